@@ -30,12 +30,23 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
-import functools
+import bisect
 import collections
 import sys
 import math
 import csv
-import copy
+import threading
+import time
+import argparse
+import contextlib
+import enum
+import itertools
+import json
+import multiprocessing
+import datetime
+import heapq
+import mmap
+import struct
 
 app_methods = [
     'tif strip shallow injection',  # PROHIBITED METHOD
@@ -76,6 +87,50 @@ inland_csv = [
     'Table6b.csv', 'Table7b.csv', 'Table8b.csv', 'Table9b.csv',
     'Table10b.csv', 'Table11b.csv', 'Table12.csv']
 
+class Units(enum.IntEnum):
+    '''Units of a product application rate'''
+    LBS = 0  # lbs product / treated acre
+    GAL = 1  # gal product / treated acre
+
+
+units_labels = ('lbs product / treated acre', 'gal product / treated acre')
+
+
+def parse_units(units):
+    '''Return the Units of a rate, from a Units or one of units_labels.
+    Raises ValueError for anything else.'''
+    if isinstance(units, Units):
+        return units
+    try:
+        return Units(units_labels.index(units))
+    except ValueError:
+        raise ValueError('Unknown units: {!r}'.format(units))
+
+
+def conversion_factor(percent, density, units):
+    '''Return lbs AI per unit of product rate: the fraction of
+    chloropicrin, times the density (lb/gallon) for rates in gallons'''
+    factor = percent / 100
+    if parse_units(units) is Units.GAL:
+        factor *= density
+    return factor
+
+
+# Lookups for per-application dispatch: county to county type, and (county
+# type, method) to the table used for it
+county_types = dict.fromkeys(inland, 'inland')
+county_types.update(dict.fromkeys(coastal, 'coastal'))
+
+tif_methods = frozenset(app_methods[:5])
+valid_methods = frozenset(app_methods)
+
+TableInfo = collections.namedtuple('TableInfo', ['file', 'label'])
+table_info = {
+    (cty_type, method): TableInfo(
+        file, 'Table ' + file.split('.')[0][len('Table'):])  # As in App. K
+    for cty_type, files in (('coastal', coastal_csv), ('inland', inland_csv))
+    for method, file in zip(app_methods[1:], files)}
+
 # assistance = ('Contact the California Department of Pesticide '
 #               'Regulation for assistance.')
 
@@ -87,42 +142,668 @@ assistance = (
     'the problem persists, then please contact the Department of Pesticide '
     'Regulation for Assistance')
 
-def read_tables(valid_methods):
-    '''Read data tables and construct lookup for tables
-    (see Appendix K, K-6)'''
 
-    def read_tabular(dir, filename):
-        values = []
-        row_index = []
-        with open(os.path.join(dir, filename), newline='') as csvfile:
-            csvreader = csv.reader(csvfile, delimiter=',')
-            col_index = [int(i) for i in next(csvreader)[1:]]
-            for row in csvreader:
-                if all(row):  # Omit empty rows at bottom of csv files
-                    row_index.append(int(row.pop(0)))
-                    row = [  # Replace "missing" values with NaN
-                        float('NaN') if cell=='NA ' else float(cell)
-                        for cell in row]
-                    values.append(row)
-        return values, row_index, col_index
+class AppkError(Exception):
+    '''Base class for invalid inputs to the buffer-zone calculation. str()
+    of the error is the message to show the user. Fields that do not apply
+    to an error are None:
+
+    number: application number(s) the error applies to
+    limit: maximum allowed by Appendix K
+    actual: value calculated from the inputs
+    table: Appendix K table file used for the lookup
+    '''
+    def __init__(self, msg, number=None, limit=None, actual=None,
+                 table=None):
+        super().__init__(msg)
+        self.number = number
+        self.limit = limit
+        self.actual = actual
+        self.table = table
+
+
+class ProhibitedMethodError(AppkError):
+    '''Application method is prohibited (TIF strip shallow injection)'''
+
+
+class LimitExceededError(AppkError):
+    '''An input or result exceeds a limit set by Appendix K'''
+
+
+class RateExceededError(LimitExceededError):
+    '''Broadcast-equivalent rate exceeds the table's maximum rate'''
+
+
+class BlockSizeExceededError(LimitExceededError):
+    '''Application block size exceeds the table's maximum acreage'''
+
+
+class BufferExceededError(LimitExceededError):
+    '''Buffer zone would exceed half a mile (NA cell in the table)'''
+
+
+class TotalAcreageError(LimitExceededError):
+    '''Combined acreage of overlapping applications exceeds the limit'''
+
+
+class InvalidInputError(AppkError):
+    '''A batch record is missing a field or has an unrecognized value'''
+
+
+class Application:
+    '''Inputs for one application. Fields not given are None. The
+    broadcast-equivalent rate is calculated from the inputs on access, and
+    the calculation never modifies an Application.
+
+    number: application number
+    regno, name, percent, density: product registration number, name,
+        percent chloropicrin and density (lb/gallon)
+    method: one of app_methods
+    rate, units: product (or, if broad_opt, broadcast-equivalent)
+        application rate and its units (Units, or one of units_labels)
+    factor: lbs AI per unit of rate (see conversion_factor); computed from
+        percent, density and units if not given
+    strip, center: strip or bed-bottom width and center-to-center row
+        spacing, in inches; ignored if broad_opt
+    block: application block size, in acres
+    date: application date (yyyy-mm-dd)
+    county: county of the application, if not the one given to main
+    start, end, x, y, radius: application times and block centroid and
+        radius in feet, for overlap detection (see overlap_groups)
+    '''
+    __slots__ = (
+        'number', 'regno', 'name', 'percent', 'density', 'method', 'rate',
+        'units', 'factor', 'strip', 'center', 'block', 'broad_opt', 'date',
+        'county', 'start', 'end', 'x', 'y', 'radius')
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.pop(field, None))
+        if fields:
+            raise TypeError('Unknown application fields: {}'.format(
+                ', '.join(fields)))
 
+    def __repr__(self):
+        return 'Application({})'.format(', '.join(
+            '{}={!r}'.format(f, getattr(self, f)) for f in self.__slots__
+            if getattr(self, f) is not None))
+
+    @property
+    def broadcast(self):
+        return broadcast_equiv_calc(self)
+
+
+class BufferResult:
+    '''Buffer zone (feet) for one application, or shared by a group of
+    overlapping non-TIF/untarped applications, with the method, broadcast-
+    equivalent rate, block size and county type used to look it up'''
+    __slots__ = ('applications', 'method', 'broadcast', 'block', 'buffer',
+                 'county_type')
+
+    def __init__(self, applications, method, broadcast, block, buffer,
+                 county_type=None):
+        self.applications = tuple(applications)
+        self.method = method
+        self.broadcast = broadcast
+        self.block = block
+        self.buffer = buffer
+        self.county_type = county_type
+
+    def __repr__(self):
+        return ('BufferResult(number={!r}, method={!r}, broadcast={!r}, '
+                'block={!r}, buffer={!r}, county_type={!r})').format(
+                    self.number, self.method, self.broadcast, self.block,
+                    self.buffer, self.county_type)
+
+    @classmethod
+    def single(cls, app, buffer, county_type=None):
+        return cls((app,), app.method, app.broadcast, app.block, buffer,
+                   county_type)
+
+    def _joined(self, field):
+        if len(self.applications) == 1:
+            return getattr(self.applications[0], field)
+        return ', '.join(str(getattr(a, field)) for a in self.applications)
+
+    @property
+    def number(self):
+        return self._joined('number')
+
+    @property
+    def name(self):
+        return self._joined('name')
+
+    @property
+    def regno(self):
+        return self._joined('regno')
+
+
+def read_tabular(dir, filename):
+    '''Read a single Appendix K table into (values, rates, acreage)'''
+    values = []
+    row_index = []
+    with open(os.path.join(dir, filename), newline='') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        col_index = [int(i) for i in next(csvreader)[1:]]
+        for row in csvreader:
+            if all(row):  # Omit empty rows at bottom of csv files
+                row_index.append(int(row.pop(0)))
+                row = [  # Replace "missing" values with NaN
+                    float('NaN') if cell=='NA ' else float(cell)
+                    for cell in row]
+                values.append(row)
+
+    # Hold both axes in ascending order so lookups can bisect them
+    col_order = sorted(range(len(col_index)), key=col_index.__getitem__)
+    rows = sorted(zip(row_index, values), key=lambda r: r[0])
+    values = [[row[j] for j in col_order] for _, row in rows]
+    row_index = [r for r, _ in rows]
+    col_index = [col_index[j] for j in col_order]
+    return values, row_index, col_index
+
+
+def base_path():
+    '''Directory of bundled data files (PyInstaller's temp folder when
+    frozen)'''
     try:
-        base_path = sys._MEIPASS
+        return sys._MEIPASS
     except:
-        base_path = os.getcwd()
-    tables_dir = os.path.join(base_path, 'Tables', '112017')
-    read_tabular = functools.partial(read_tabular, tables_dir)
-    coastal_tbls = [read_tabular(csv) for csv in coastal_csv]
-    inland_tbls = [read_tabular(csv) for csv in inland_csv]
+        return os.getcwd()
+
+
+def default_tables_dir():
+    '''Directory of the bundled Appendix K tables: the active table set
+    (see TableSets), or Tables/112017 if there are none'''
+    if table_sets.active:
+        return table_sets.path(table_sets.active)
+    return os.path.join(base_path(), 'Tables', '112017')
+
+
+def default_compiled_path():
+    '''Path of the tables file written by compile_tables and bundled with
+    the frozen executable, or None when running from source, so that
+    edited CSV files and table sets are never shadowed by a stale build'''
+    if not hasattr(sys, '_MEIPASS'):
+        return None
+    return os.path.join(sys._MEIPASS, 'appk_tables.bin')
+
+
+# Layout of a compiled tables file. All integers are little-endian.
+#   header: magic, version, number of tables, offset and length of products
+#   directory: one entry per table: file name, number of rates, number of
+#       block sizes, offset of table data
+#   table data (8-byte aligned): rates (int32), block sizes (int32), padding
+#       to 8 bytes, then values (float64, row-major by rate; NaN for NA)
+#   products: UTF-8 JSON list of [regno, name, percent, density] rows
+compiled_magic = b'APPK'
+compiled_version = 1
+compiled_header = struct.Struct('<4sHHII')
+compiled_entry = struct.Struct('<16sHHI')
+
+
+def compile_tables(out_path, tables_dir=None, products_path=None):
+    '''Compile the Appendix K tables and the products sheet into a single
+    binary file that CompiledTables can read without parsing any CSV. Run
+    at build time (see guik.spec).'''
+    def align(n):
+        return n + -n % 8
+
+    tables_dir = tables_dir or default_tables_dir()
+    filenames = list(collections.OrderedDict.fromkeys(
+        coastal_csv + inland_csv))
+    products_path = products_path or os.path.join(
+        base_path(), 'chloropicrin_products.csv')
+    products = json.dumps(
+        [list(p) for p in read_products(products_path)]).encode('utf-8')
+
+    offset = align(compiled_header.size
+                   + compiled_entry.size * len(filenames))
+    entries, blobs = [], []
+    for filename in filenames:
+        vals, rates, acreage = read_tabular(tables_dir, filename)
+        axes = struct.pack('<{}i'.format(len(rates) + len(acreage)),
+                           *(rates + acreage))
+        axes += bytes(-len(axes) % 8)
+        cells = [v for row in vals for v in row]
+        blob = axes + struct.pack('<{}d'.format(len(cells)), *cells)
+        entries.append(compiled_entry.pack(
+            filename.encode('ascii'), len(rates), len(acreage), offset))
+        blobs.append(blob)
+        offset += len(blob)
+
+    with open(out_path, 'wb') as f:
+        f.write(compiled_header.pack(
+            compiled_magic, compiled_version, len(filenames), offset,
+            len(products)))
+        f.write(b''.join(entries))
+        f.write(bytes(-f.tell() % 8))
+        for blob in blobs:
+            f.write(blob)
+        f.write(products)
+
+
+class CompiledTables:
+    '''Read-only, memory-mapped view of a file written by compile_tables'''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, self._products_offset, self._products_length = (
+            compiled_header.unpack_from(self._buf))
+        if magic != compiled_magic or version != compiled_version:
+            raise ValueError(
+                '{} is not a compiled tables file (version {})'.format(
+                    path, compiled_version))
+        self._index = {}
+        for i in range(n):
+            name, n_rates, n_acres, offset = compiled_entry.unpack_from(
+                self._buf, compiled_header.size + i * compiled_entry.size)
+            self._index[name.rstrip(b'\0').decode('ascii')] = (
+                n_rates, n_acres, offset)
+
+    def _layout(self, filename):
+        n_rates, n_acres, offset = self._index[filename]
+        axes_size = 4 * (n_rates + n_acres)
+        return n_rates, n_acres, offset, offset + axes_size + -axes_size % 8
+
+    def table(self, filename):
+        '''Return (values, rates, acreage) as read_tabular would'''
+        n_rates, n_acres, offset, values_offset = self._layout(filename)
+        axes = struct.unpack_from(
+            '<{}i'.format(n_rates + n_acres), self._buf, offset)
+        cells = struct.unpack_from(
+            '<{}d'.format(n_rates * n_acres), self._buf, values_offset)
+        values = [list(cells[i:i + n_acres])
+                  for i in range(0, len(cells), n_acres)]
+        return values, list(axes[:n_rates]), list(axes[n_rates:])
+
+    def grid(self, filename):
+        '''Return (values, rates, acreage) as NumPy arrays, with values
+        read directly from the mapped file'''
+        import numpy as np
+        n_rates, n_acres, offset, values_offset = self._layout(filename)
+        axes = np.frombuffer(self._buf, dtype='<i4', count=n_rates + n_acres,
+                             offset=offset).astype(float)
+        values = np.frombuffer(self._buf, dtype='<f8',
+                               count=n_rates * n_acres,
+                               offset=values_offset)
+        return (values.reshape(n_rates, n_acres), axes[:n_rates],
+                axes[n_rates:])
+
+    def close(self):
+        self._buf.close()
+
+    def products(self):
+        '''Return the ProductRegistry, as read_products would'''
+        start = self._products_offset
+        rows = json.loads(
+            bytes(self._buf[start:start + self._products_length]).decode(
+                'utf-8'))
+        return ProductRegistry(Product(*row) for row in rows)
+
+
+class LookupCache:
+    '''Least-recently-used cache of buffer lookups, counting hits, misses
+    and evictions. A maxsize of 0 disables caching.'''
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        '''Return the cached value for key, or None'''
+        if not self.maxsize:
+            return None
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def resize(self, maxsize):
+        '''Change maxsize, evicting least-recently-used entries to fit'''
+        self.maxsize = maxsize
+        with self._lock:
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._entries),
+                'maxsize': self.maxsize}
+
+
+class TableRegistry:
+    '''Process-wide cache of Appendix K tables. Each table is read from disk
+    the first time a (method, county type) pair is requested and is served
+    from memory afterward. Call invalidate() or reload() if the tables
+    directory changes.
+
+    Without a tables directory, tables are read from the compiled tables
+    file (see compile_tables) at compiled_path, or the one bundled with the
+    frozen executable, if it exists, else from the bundled CSV files.
+
+    `cache` is a LookupCache of buffer lookups (see lookup_buffer), emptied
+    whenever the tables are invalidated. It is off (cache_size 0) by
+    default: even with nearly every lookup a hit, the cache's bookkeeping
+    costs more than reading the table cell it saves.'''
+    def __init__(self, tables_dir=None, compiled_path=None,
+                 cache_size=0):
+        self.tables_dir = tables_dir
+        self.compiled_path = compiled_path
+        self.cache = LookupCache(cache_size)
+        self._compiled = None
+        self._tables = {}
+        self._grids = {}
+        self._frontiers = {}
+        self._lock = threading.Lock()
+
+    def compiled(self):
+        '''Return the CompiledTables tables are read from, or None if they
+        are read from CSV files'''
+        if self.tables_dir is None and self._compiled is None:
+            path = self.compiled_path or default_compiled_path()
+            if path and os.path.exists(path):
+                self._compiled = CompiledTables(path)
+        return self._compiled
+
+    def get(self, method, county_type):
+        '''Return (values, rates, acreage) for a method and county type'''
+        key = (method, county_type)
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._tables:
+                filename = table_file(method, county_type)
+                compiled = self.compiled()
+                if compiled:
+                    self._tables[key] = compiled.table(filename)
+                else:
+                    self._tables[key] = read_tabular(
+                        self.tables_dir or default_tables_dir(), filename)
+            return self._tables[key]
+
+    def frontiers(self, method, county_type):
+        '''Return (by_block, by_rate) for a method and county type, for
+        max_rate and max_block. by_block[j] lists, for each rate index i,
+        the largest buffer at any rate up to rates[i] for acreage[j], so it
+        never decreases and can be bisected. by_rate[i] does the same
+        across block sizes for rates[i]. NA cells count as infinite.'''
+        key = (method, county_type)
+        try:
+            return self._frontiers[key]
+        except KeyError:
+            pass
+        vals = self.get(method, county_type)[0]
+        cells = [[math.inf if math.isnan(v) else v for v in row]
+                 for row in vals]
+        by_block = [list(itertools.accumulate(col, max))
+                    for col in zip(*cells)]
+        by_rate = [list(itertools.accumulate(row, max)) for row in cells]
+        with self._lock:
+            return self._frontiers.setdefault(key, (by_block, by_rate))
+
+    def grid(self, method, county_type):
+        '''Return the table for a method and county type as NumPy arrays
+        (values, rates, acreage), for use by calculate_batch'''
+        key = (method, county_type)
+        try:
+            return self._grids[key]
+        except KeyError:
+            pass
+        import numpy as np
+        compiled = self.compiled()
+        if compiled:
+            grid = compiled.grid(table_file(method, county_type))
+        else:
+            vals, rates, acreage = self.get(method, county_type)
+            grid = (np.array(vals, dtype=float),
+                    np.array(rates, dtype=float),
+                    np.array(acreage, dtype=float))
+        with self._lock:
+            return self._grids.setdefault(key, grid)
+
+    def invalidate(self, tables_dir=None):
+        '''Drop all cached tables, optionally pointing the registry at a
+        different tables directory. Tables are re-read on next use.'''
+        with self._lock:
+            if tables_dir is not None:
+                self.tables_dir = tables_dir
+            self._compiled = None
+            self._tables = {}
+            self._grids = {}
+            self._frontiers = {}
+            self.cache.clear()
+
+    def reload(self, tables_dir=None):
+        '''Invalidate and immediately re-read every table that was cached'''
+        keys = list(self._tables)
+        self.invalidate(tables_dir)
+        for method, county_type in keys:
+            self.get(method, county_type)
+
+
+tables = TableRegistry()
+
+
+def table_set_date(name):
+    '''Return the date a table set took effect from its directory name,
+    either MMYYYY (taken as the first of the month) or YYYY-MM-DD, or None
+    if the name is neither'''
+    for fmt in ('%m%Y', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(name, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def application_date(app):
+    '''Return the date of an application, from its date (yyyy-mm-dd) or
+    else its start time, or None if it has neither'''
+    date = app.date or app.start
+    if date is None or date == '':
+        return None
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    try:
+        return datetime.datetime.strptime(str(date), '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidInputError(
+            'Application {} has an invalid date ({}); use yyyy-mm-dd.'.format(
+                app.number, date),
+            number=app.number)
+
+
+class TableSets:
+    '''Revisions of the Appendix K tables, each a directory under root named
+    for the date it took effect (see table_set_date), e.g. Tables/112017.
+    A directory is a table set only if it holds every file in coastal_csv
+    and inland_csv; others are listed in `invalid`. Each set is read
+    lazily through its own TableRegistry.
+
+    Applications are calculated with the set in force on their date (see
+    select), and applications without a date with the active set, the
+    newest unless another is activated. rescan() and activate() swap the
+    sets atomically: calculations already running finish with the sets they
+    started with. If root holds no table sets, `tables` is used.
+
+    `default` is a TableRegistry reading from the active set (see
+    default_tables_dir), invalidated whenever the active set changes.'''
+    def __init__(self, root=None, default=None):
+        self.root = root
+        self.default = default
+        self.invalid = {}  # Directory name to reason
+        self._versions = None  # [(date, name)], oldest first; found lazily
+        self._active = None
+        self._registries = {}
+        self._lock = threading.Lock()
+
+    def rescan(self, root=None):
+        '''(Re)discover the table sets under root (by default, the current
+        root, else Tables in the bundled data directory), returning their
+        names, oldest first. The active set stays active if it still
+        exists; otherwise the newest set becomes active.'''
+        root = root or self.root or os.path.join(base_path(), 'Tables')
+        needed = set(coastal_csv + inland_csv)
+        versions, invalid = [], {}
+        names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+        for name in names:
+            path = os.path.join(root, name)
+            date = table_set_date(name)
+            if date is None or not os.path.isdir(path):
+                continue
+            missing = needed.difference(os.listdir(path))
+            if missing:
+                invalid[name] = 'missing ' + ', '.join(sorted(missing))
+            else:
+                versions.append((date, name))
+        versions.sort()
+
+        with self._lock:
+            scanned = self._versions is not None
+            previous = self._active_path()
+            if root != self.root:
+                self._registries = {}
+            self.root = root
+            self.invalid = invalid
+            self._versions = versions
+            if self._active not in (name for _, name in versions):
+                self._active = versions[-1][1] if versions else None
+        if scanned:  # Nothing was read from a set before the first scan
+            self._swapped(previous)
+        return [name for _, name in versions]
+
+    def _active_path(self):
+        return self._active and self.path(self._active)
+
+    def _swapped(self, previous):
+        '''Invalidate the default registry if the active set has changed
+        from the one at path previous. Called outside self._lock, and never
+        from the first scan, which may run while the registry holds its own
+        lock to look up the active set.'''
+        if self.default is not None and self._active_path() != previous:
+            self.default.invalidate()
+
+    def versions(self):
+        '''Names of the table sets, oldest first'''
+        if self._versions is None:
+            self.rescan()
+        return [name for _, name in self._versions]
+
+    @property
+    def active(self):
+        '''Name of the active table set, or None if there are none'''
+        if self._versions is None:
+            self.rescan()
+        return self._active
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def registry(self, name):
+        '''Return the TableRegistry of a table set'''
+        if name not in self.versions():
+            raise ValueError('No table set named {} in {}.'.format(
+                name, self.root))
+        with self._lock:
+            if name not in self._registries:
+                self._registries[name] = TableRegistry(self.path(name))
+            return self._registries[name]
+
+    def validate(self, name):
+        '''Read every table of a table set, raising ValueError if a table
+        does not have a value for each of its rates and block sizes'''
+        registry = self.registry(name)
+        for (cty_type, method), info in table_info.items():
+            vals, rates, acreage = registry.get(method, cty_type)
+            if not (rates and acreage and len(vals) == len(rates) and
+                    all(len(row) == len(acreage) for row in vals)):
+                raise ValueError('Table {} of table set {} is malformed.'.format(
+                    info.file, name))
+
+    def activate(self, name):
+        '''Validate a table set and make it the active set'''
+        self.validate(name)
+        with self._lock:
+            previous = self._active_path()
+            self._active = name
+        self._swapped(previous)
+
+    def for_date(self, date):
+        '''Return the TableRegistry of the table set in force on a date'''
+        if self._versions is None:
+            self.rescan()
+        versions = self._versions
+        i = bisect.bisect_right([d for d, _ in versions], date) - 1
+        if i < 0:
+            raise InvalidInputError(
+                'No Appendix K tables were in force on {}.'.format(date))
+        return self.registry(versions[i][1])
+
+    def select(self, applications):
+        '''Return the TableRegistry for each application: the set in force
+        on its date, else the active set'''
+        active = self.active
+        if active is None:
+            return [tables] * len(applications)
+        default = self.registry(active)
+        registries = []
+        for app in applications:
+            date = application_date(app)
+            if date is None:
+                registries.append(default)
+                continue
+            try:
+                registries.append(self.for_date(date))
+            except InvalidInputError:
+                raise InvalidInputError(
+                    'No Appendix K tables were in force on {}, the date of '
+                    'application {}.'.format(date, app.number),
+                    number=app.number)
+        return registries
+
+
+table_sets = TableSets(default=tables)
+
+
+def read_tables(valid_methods):
+    '''Read data tables and construct lookup for tables
+    (see Appendix K, K-6)'''
     lookup_tbl = collections.defaultdict(dict)
-    for i, v in enumerate(valid_methods):
-        lookup_tbl[v]['coastal'] = coastal_tbls[i]
-        lookup_tbl[v]['inland'] = inland_tbls[i]
+    for v in valid_methods:
+        lookup_tbl[v]['coastal'] = tables.get(v, 'coastal')
+        lookup_tbl[v]['inland'] = tables.get(v, 'inland')
 
     return lookup_tbl
 
 
-def recalculate(apps, cb_list):
+def recalculate(apps, cb_list, county_types=None):
     '''
     For overlapping non-TIF or untarped applications, each application block
     has the same buffer zone. It is found by using the highest application
@@ -131,73 +812,152 @@ def recalculate(apps, cb_list):
     overlapping blocks, calculate each buffer zone based on the details of the
     individual applications--just as for the TIF applications (overlapping or
     otherwise--only the total acreage limitation matters for TIF applications).
+
+    cb_list is [county type, lookup]. For a group spanning coastal and
+    inland counties, county_types lists each application's county type, and
+    the tables for both are searched for the highest value.
     '''
-    # Calculate potential buffer zones
-    acreage = sum(a['block'] for a in apps)
-    max_broad = max(a['broadcast'] for a in apps)
-    app_copies = copy.deepcopy(apps)
-    for app in app_copies:
-        app['block'] = acreage
-        app['broadcast'] = max_broad
-    buffers = [calculate_buffer(app, *cb_list) for app in app_copies]
-    buffer = max(buffers)
-    idx = buffers.index(buffer)
-
-    # Construct a single, partial application representing all apps
-    # for display by the script that called this one
-    new = {}
-    new['number'] = ', '.join(str(a['number']) for a in apps)
-    new['name'] = ', '.join(str(a['name']) for a in apps)
-    new['regno'] = ', '.join(str(a['regno']) for a in apps)
-    new['block'] = acreage
-    new['broadcast'] = max_broad
-    new['method'] = apps[idx]['method']
-
-    return [new], [buffer]
-
-
-def calculate_buffer(app, county_type, lookup):
-    def closest_idx(param, indices, strings):
-        '''
-        Look up value in table, "round up to the nearest rate and block size,
-        where applicable" (--Table caption), and verify that app rate and
-        app block size are within the ranges allowed in the table
-        '''
+    county_type, lookup = cb_list
+    if county_types is None:
+        county_types = [county_type] * len(apps)
+
+    # Calculate potential buffer zones, once per distinct method (and
+    # county type)
+    acreage = sum(a.block for a in apps)
+    max_broad = max(a.broadcast for a in apps)
+    buffers = collections.OrderedDict()
+    for app, cty_type in zip(apps, county_types):
+        if (app.method, cty_type) not in buffers:
+            buffers[(app.method, cty_type)] = lookup_buffer(
+                app.method, max_broad, acreage, cty_type, lookup,
+                number=app.number)
+    key = max(buffers, key=buffers.get)  # First method with max buffer
+    method, cty_type = key
+
+    # A single result representing all apps, for display by the script
+    # that called this one
+    return BufferResult(apps, method, max_broad, acreage, buffers[key],
+                        cty_type)
+
+
+rate_strings = ('Broadcast equivalent application rate', 'lbs AI/acre', 'rate')
+acre_strings = ('Application block size', 'acres', 'block size')
+
+
+def classify_county(county):
+    '''Return the county type ('coastal' or 'inland') of a county. Unlisted
+    counties are treated as inland.'''
+    return county_types.get(county, 'inland')
+
+
+def table_file(method, county_type):
+    '''Return the name of the table file for a method and county type'''
+    return table_info[(county_type, method)].file
+
+
+def table_label(method, county_type):
+    '''Return the table for a method and county type as named in Appendix
+    K, such as 'Table 6a'.'''
+    return table_info[(county_type, method)].label
+
+
+def closest_idx(param, indices, strings, error=AppkError, **fields):
+    '''
+    Look up value in table, "round up to the nearest rate and block size,
+    where applicable" (--Table caption), and verify that app rate and
+    app block size are within the ranges allowed in the table. `indices`
+    must be sorted in ascending order. Raises `error`, with any extra
+    fields, if param is out of range.
+    '''
+    if not param <= indices[-1]:  # Also rejects NaN
         error_msg = (
             '{} ({} {}) exceeds maximum allowable {} ({} {}). '
             ) + assistance
+        raise error(
+            error_msg.format(
+                strings[0],
+                truncate(param, 1),
+                strings[1],
+                strings[2],
+                indices[-1],
+                strings[1]),
+            limit=indices[-1],
+            actual=param,
+            **fields)
 
-        diffs = [diff for diff in map(lambda x: param - x, indices)]
-        try:
-            closest_diff = max(diff for diff in diffs if diff<=0)
-        except ValueError:
-            print(error_msg.format(
-                    strings[0],
-                    truncate(param, 1),
-                    strings[1],
-                    strings[2],
-                    indices[-1],
-                    strings[1]))
-            sys.exit()
+    return bisect.bisect_left(indices, param)
 
-        return diffs.index(closest_diff)
 
+def lookup_buffer(method, broadcast, block, county_type, lookup=tables,
+                  number=None):
+    '''Look up the buffer zone for a method, broadcast-equivalent rate and
+    block size. `number` is the application number reported in errors.
+
+    With a TableRegistry, buffers are cached in its LookupCache, keyed on
+    the indices of the tabulated rate and block size they round up to, so
+    every input in the same table cell hits. Errors are not cached.'''
     # Lookup correct table for combination of application method and county
-    vals, rates, acreage = lookup[app['method']][county_type]
-    rate_strings = ['Broadcast equivalent application rate', 'lbs AI/acre',
-         'rate']
-    closest_idx_rate = closest_idx(app['broadcast'], rates, rate_strings)
-    acre_strings = ['Application block size', 'acres', 'block size']
-    closest_idx_acre = closest_idx(app['block'], acreage,
-                                   acre_strings)
+    registry = isinstance(lookup, TableRegistry)
+    if registry:
+        vals, rates, acreage = lookup.get(method, county_type)
+    else:
+        vals, rates, acreage = lookup[method][county_type]
+    fields = {'number': number, 'table': table_file(method, county_type)}
+    closest_idx_rate = closest_idx(broadcast, rates, rate_strings,
+                                   RateExceededError, **fields)
+    closest_idx_acre = closest_idx(block, acreage,
+                                   acre_strings, BlockSizeExceededError,
+                                   **fields)
+    if registry:
+        key = (county_type, method, closest_idx_rate, closest_idx_acre)
+        buffer = lookup.cache.get(key)
+        if buffer is not None:
+            return buffer
     buffer = vals[closest_idx_rate][closest_idx_acre]
     if math.isnan(buffer):  # Verify that value is not NA
-        print(
+        raise BufferExceededError(
             'Based on the inputs, one or more buffer zones would exceed the '
-            'maximum size of half a mile. ' + assistance)
-        sys.exit()
+            'maximum size of half a mile. ' + assistance,
+            limit=2640,
+            **fields)
 
-    return int(buffer)
+    buffer = int(buffer)
+    if registry:
+        lookup.cache.put(key, buffer)
+    return buffer
+
+
+def calculate_buffer(app, county_type, lookup=tables):
+    return lookup_buffer(app.method, app.broadcast, app.block, county_type,
+                         lookup, app.number)
+
+
+def max_rate(county_type, method, max_buffer, block, lookup=tables):
+    '''Return the largest tabulated broadcast-equivalent rate (lbs AI/acre)
+    such that an application of `block` acres at that rate, or at any lower
+    rate, has a buffer zone of at most max_buffer feet. Returns None if even
+    the lowest rate's buffer is too large. Raises BlockSizeExceededError if
+    block exceeds the table.'''
+    vals, rates, acreage = lookup.get(method, county_type)
+    j = closest_idx(block, acreage, acre_strings, BlockSizeExceededError,
+                    table=table_file(method, county_type))
+    by_block = lookup.frontiers(method, county_type)[0]
+    i = bisect.bisect_right(by_block[j], max_buffer) - 1
+    return rates[i] if i >= 0 else None
+
+
+def max_block(county_type, method, max_buffer, broadcast, lookup=tables):
+    '''Return the largest tabulated block size (acres) such that an
+    application at a broadcast-equivalent rate of `broadcast`, on that or
+    any smaller block, has a buffer zone of at most max_buffer feet. Returns
+    None if even the smallest block's buffer is too large. Raises
+    RateExceededError if broadcast exceeds the table.'''
+    vals, rates, acreage = lookup.get(method, county_type)
+    i = closest_idx(broadcast, rates, rate_strings, RateExceededError,
+                    table=table_file(method, county_type))
+    by_rate = lookup.frontiers(method, county_type)[1]
+    j = bisect.bisect_right(by_rate[i], max_buffer) - 1
+    return acreage[j] if j >= 0 else None
 
 
 def broadcast_equiv_calc(app):
@@ -206,30 +966,132 @@ def broadcast_equiv_calc(app):
     Note that broadcast is given in units of lbs
     product/acre in product labels, but as lbs
     AI/acre in Appendix K's tables.
+
+    The rate is converted with a single multiply by the application's
+    factor, precomputed per product and units by ProductRegistry. Rounding
+    to 9 decimal places drops the floating-point error of the folded
+    factor, so that round inputs land exactly on tabulated rates. The
+    application is not modified.
+    '''
+    factor = app.factor
+    if factor is None:
+        factor = conversion_factor(app.percent, app.density, app.units)
+    rate_ai = app.rate * factor
+    if abs(rate_ai) < 1e9:  # Leaves NaN and infinity for closest_idx
+        rate_ai = math.floor(rate_ai * 1e9 + 0.5) / 1e9
+
+    if app.broad_opt:  # Strip and center are ignored
+        return rate_ai
+
+    return rate_ai * app.strip / app.center
+
+# Per-row status codes returned by calculate_batch
+STATUS_OK = 0
+STATUS_PROHIBITED = 1  # TIF strip shallow injection
+STATUS_UNKNOWN_METHOD = 2
+STATUS_RATE_EXCEEDED = 3  # Broadcast rate above the table's maximum rate
+STATUS_BLOCK_EXCEEDED = 4  # Block size above the table's maximum acreage
+STATUS_BUFFER_EXCEEDED = 5  # Buffer zone would exceed half a mile (NA cell)
+STATUS_UNKNOWN_UNITS = 6  # Units neither one of units_labels nor Units
+
+
+def calculate_batch(county_type, method, rate, percent, density, units,
+                    strip, center, block, lookup=tables):
+    '''Vectorized broadcast_equiv_calc and calculate_buffer over column
+    arrays of applications, all in one county type. For direct input of
+    broadcast rates, pass strip and center values of 1. Units may be given
+    as units_labels or Units values, as for parse_units.
+
+    Rather than raising AppkError on the first invalid application,
+    reports a per-row status code (see STATUS_* above).
+    Returns a tuple (broadcast, buffer, status) of arrays; buffer is 0
+    wherever status is not STATUS_OK, and broadcast is NaN for unknown
+    units. Requires NumPy.
     '''
-    rate_ai = app['rate'] * app['percent'] / 100
-    if app['units'] == 'gal product / treated acre':
-        rate_ai *= app['density']
+    import numpy as np
+
+    method = np.asarray(method)
+    rate = np.asarray(rate, dtype=float)
+    percent = np.asarray(percent, dtype=float)
+    density = np.asarray(density, dtype=float)
+    block = np.asarray(block, dtype=float)
+
+    # Match units to Units by label or value (see parse_units)
+    units = np.asarray(units)
+    matches = {}
+    for u in Units:
+        match = np.zeros(units.shape, dtype=bool)
+        if units.dtype.kind in 'UO':
+            match |= units == units_labels[u]
+        if units.dtype.kind in 'iuO':
+            match |= units == u
+        matches[u] = match
+    unknown_units = ~(matches[Units.LBS] | matches[Units.GAL])
+
+    # Broadcast calculations
+    factor = np.where(matches[Units.GAL], percent / 100 * density,
+                      percent / 100)
+    factor[unknown_units] = np.nan
+    # Rounded as in broadcast_equiv_calc
+    rate_ai = rate * factor
+    finite = np.abs(rate_ai) < 1e9
+    rate_ai[finite] = np.floor(rate_ai[finite] * 1e9 + 0.5) / 1e9
+    broadcast = rate_ai * np.asarray(strip, dtype=float) / np.asarray(
+        center, dtype=float)
+
+    buffer = np.zeros(broadcast.shape, dtype=np.int64)
+    status = np.full(broadcast.shape, STATUS_UNKNOWN_METHOD, dtype=np.int8)
+    status[method == app_methods[0]] = STATUS_PROHIBITED
 
-    if app['broad_opt']:
-        app['strip'], app['center'] = 1, 1
+    # Round up to the tabulated rate and block size, one table at a time
+    for m in app_methods[1:]:
+        rows = np.flatnonzero(method == m)
+        if not rows.size:
+            continue
+        vals, rates, acreage = lookup.grid(m, county_type)
+        b, a = broadcast[rows], block[rows]
+        over_rate = ~(b <= rates[-1])  # Also catches NaN
+        over_block = ~(a <= acreage[-1])
+        ok = ~(over_rate | over_block)
+        cells = np.full(rows.shape, np.nan)
+        cells[ok] = vals[
+            np.searchsorted(rates, b[ok]),
+            np.searchsorted(acreage, a[ok])]
+        over_buffer = ok & np.isnan(cells)
+        ok &= ~over_buffer
 
-    broadcast = rate_ai * app['strip'] / app['center']
+        row_status = np.full(rows.shape, STATUS_OK, dtype=np.int8)
+        row_status[over_buffer] = STATUS_BUFFER_EXCEEDED
+        row_status[over_block] = STATUS_BLOCK_EXCEEDED
+        row_status[over_rate] = STATUS_RATE_EXCEEDED
+        status[rows] = row_status
+        buffer[rows[ok]] = cells[ok].astype(np.int64)
+
+    # As in resolve_record, units are checked after the method
+    unknown_units &= status != STATUS_PROHIBITED
+    unknown_units &= status != STATUS_UNKNOWN_METHOD
+    status[unknown_units] = STATUS_UNKNOWN_UNITS
+    buffer[unknown_units] = 0
+
+    return broadcast, buffer, status
 
-    return broadcast
 
 def check_total_acreage(apps, tarp_type, limit):
     '''Individual application blocks are limited to 60 and 40 acres, resp.,
     for TIF and non-TIF/untarped apps. In addition, combined acreage is
-    limited for groups of overlapping applications, to these same values.'''
+    limited for groups of overlapping applications, to these same values.
+    Raises TotalAcreageError if the limit is exceeded.'''
     msg = (
         'Groups of overlapping {} applications are limited to {} acres in '
         'total. The total area of this group is {} acres.'
     )
-    acreage = sum(app['block'] for app in apps)
+    acreage = sum(app.block for app in apps)
     if acreage > limit:
-        print(msg.format(tarp_type, limit, acreage))
-        sys.exit()
+        raise TotalAcreageError(
+            msg.format(tarp_type, limit, acreage),
+            number=', '.join(str(app.number) for app in apps),
+            limit=limit,
+            actual=acreage)
 
 
 def truncate(f, n):
@@ -239,47 +1101,872 @@ def truncate(f, n):
     return '.'.join([i, (d+'0'*n)[:n]])
 
 
-def main(recalc, county, applications):
-    '''Main routine'''
+class Stats:
+    '''Opt-in instrumentation for main: the number of times each stage ran
+    and its total time in seconds. Nothing is printed. Stages are
+
+    main: a call of main
+    read_tables: loading the tables main needs, if not already loaded
+    lookup <method>: one buffer lookup for an application
+    recalculate: the shared buffer of a group of overlapping applications
+    error <exception class>: an error raised by main (counted, not timed)
+    cache hits, cache misses: lookups answered, or not, by the table
+        registry's LookupCache (counted, not timed; approximate if other
+        threads use the registry at the same time)
+
+    If given, callback(stage, seconds) is called as each stage is recorded,
+    with seconds None for errors.'''
+    def __init__(self, callback=None):
+        self.counts = collections.Counter()
+        self.timings = collections.defaultdict(float)
+        self.callback = callback
+
+    def __repr__(self):
+        return 'Stats({!r})'.format(self.as_dict())
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Time the body of a with statement as a stage'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds=None):
+        self.counts[name] += 1
+        if seconds is not None:
+            self.timings[name] += seconds
+        if self.callback:
+            self.callback(name, seconds)
+
+    def merge(self, other):
+        '''Add the counts and timings of another Stats, or of its as_dict'''
+        if isinstance(other, Stats):
+            other = other.as_dict()
+        for name, stage in other.items():
+            self.counts[name] += stage['count']
+            if stage['seconds'] is not None:
+                self.timings[name] += stage['seconds']
+
+    def as_dict(self):
+        return {name: {'count': count, 'seconds': self.timings.get(name)}
+                for name, count in self.counts.items()}
+
+    def summary(self):
+        '''Return a table of the stages, slowest first'''
+        lines = ['{:<50} {:>10} {:>12}'.format('stage', 'count', 'seconds')]
+        for name, count in sorted(
+                self.counts.items(),
+                key=lambda item: (-self.timings.get(item[0], -1), item[0])):
+            seconds = self.timings.get(name)
+            lines.append('{:<50} {:>10} {:>12}'.format(
+                name, count, '' if seconds is None else
+                '{:.6f}'.format(seconds)))
+        return '\n'.join(lines)
+
+
+def main(recalc, county, applications, progress=None, stats=None,
+         lookup=None):
+    '''Main routine. Returns a list of BufferResult: one per TIF
+    application, then one per non-TIF/untarped application or, if recalc is
+    set, one shared by all of them. Applications are not modified.
+
+    Each application is calculated for its own county, if it has one, else
+    for `county`, so one call can cover applications in many counties.
+    Applications are classified by county type once, and the tables each
+    county type needs are resolved before any lookups.
+
+    If given, progress(done, total) is called as buffers are calculated,
+    with the number of applications done so far. An exception raised by
+    progress (e.g., to cancel the calculation) propagates to the caller.
+
+    If given a Stats, main records its stages in it (see Stats).
+
+    Tables are looked up in `lookup`, a TableRegistry (by default,
+    `tables`), or a TableSets to calculate each application with the table
+    set in force on its date. Overlapping applications calculated together
+    use the set of the latest of them.'''
+    if stats is None:
+        return _main(recalc, county, applications, progress, None, lookup)
+
+    used = {}  # Registries used, with their cache counts beforehand
+    try:
+        with stats.stage('main'):
+            return _main(recalc, county, applications, progress, stats,
+                         lookup, used)
+    except AppkError as e:
+        stats.record('error ' + type(e).__name__)
+        raise
+    finally:
+        for registry, hits, misses in used.values():
+            stats.counts['cache hits'] += registry.cache.hits - hits
+            stats.counts['cache misses'] += registry.cache.misses - misses
+
+
+def _main(recalc, county, applications, progress, stats, lookup,
+          used=None):
+    def stage(name):  # Time a stage only if stats are being collected
+        return stats.stage(name) if stats else contextlib.nullcontext()
+
     for app in applications:
         # Prohibited-application check
-        if app['method'] == app_methods[0]:
-            print('TIF strip shallow injection is prohibited. ' +
-                assistance)
-            sys.exit()
-        # Broadcast calculations
-        app['broadcast'] = broadcast_equiv_calc(app)
+        if app.method == app_methods[0]:
+            raise ProhibitedMethodError(
+                'TIF strip shallow injection is prohibited. ' + assistance,
+                number=app.number)
 
     # Split applications into lists of tif and untarped/non-tif
-    tif_methods = app_methods[:5]
-    tif_apps = [app for app in applications if app['method'] in tif_methods]
-    other_apps = [app for app in applications if app not in tif_apps]
+    tif_apps = [app for app in applications if app.method in tif_methods]
+    other_apps = [app for app in applications
+                  if app.method not in tif_methods]
 
     # Check total acreage for overlapping applications
     if recalc:
         check_total_acreage(tif_apps, 'TIF', 60)
         check_total_acreage(other_apps, 'non-TIF/untarped', 40)
 
+    # Classify applications by county type, choose their table sets, and
+    # resolve the tables for each table set, county type and method
+    cty_types = {}  # id(app) to county type
+    for app in applications:
+        app_county = app.county or county
+        if not app_county:
+            raise InvalidInputError(
+                'No county was given for application {}.'.format(app.number),
+                number=app.number)
+        cty_types[id(app)] = classify_county(app_county)
+    if isinstance(lookup, TableSets):
+        registries = dict(zip(map(id, applications),
+                              lookup.select(applications)))
+    else:
+        registries = dict.fromkeys(map(id, applications), lookup or tables)
+    if used is not None:
+        for registry in registries.values():
+            used[id(registry)] = (
+                registry, registry.cache.hits, registry.cache.misses)
+    needed = {(registries[id(app)], app.method, cty_types[id(app)])
+              for app in applications}
+    with stage('read_tables'):
+        for registry, method, cty_type in needed:
+            registry.get(method, cty_type)
+
     # (Re)calculate buffers; check acreage and broadcast rates against limits
-    lookup_table = read_tables(app_methods[1:])
-    cty_type = 'coastal' if county in coastal else 'inland'
-    args_cb = [cty_type, lookup_table]
+    results = []
+    singles = tif_apps if recalc else tif_apps + other_apps
+    for app in singles:
+        cty_type = cty_types[id(app)]
+        registry = registries[id(app)]
+        with stage('lookup ' + app.method):
+            buffer = calculate_buffer(app, cty_type, registry)
+        results.append(BufferResult.single(app, buffer, cty_type))
+        if progress:
+            progress(len(results), len(applications))
+
+    if other_apps and recalc:
+        other_types = [cty_types[id(app)] for app in other_apps]
+        group = other_apps[0]
+        if isinstance(lookup, TableSets):  # Use the latest one's table set
+            group = max(other_apps, key=lambda app: (
+                application_date(app) or datetime.date.min))
+        args_cb = [other_types[0], registries[id(group)]]
+        with stage('recalculate'):
+            results.append(recalculate(other_apps, args_cb, other_types))
+        if progress:
+            progress(len(applications), len(applications))
+
+    return results
+
+
+def app_results(apps, results):
+    '''Map the results of main back to its applications, returning the
+    result holding each application's buffer'''
+    by_app = {id(app): result for result in results
+              for app in result.applications}
+    return [by_app[id(app)] for app in apps]
+
+
+overlap_window = datetime.timedelta(hours=36)
+
+
+def block_radius(app):
+    '''Radius (feet) of an application block, from its radius if given,
+    else from a circle with the block's acreage'''
+    return app.radius or math.sqrt(app.block * 43560 / math.pi)
+
+
+def overlap_groups(apps, buffers, groups=()):
+    '''Return groups (sorted lists of indices into apps) of applications
+    whose buffer zones overlap within 36 hours from the end of each earlier
+    application to the start of each later one. Overlap is cumulative, so
+    groups are the connected components of the overlap graph. Indices
+    already grouped together in `groups` stay together.
+
+    Each Application needs start and end datetimes, block centroid x and y
+    in feet (in a projected coordinate system), and block or radius (see
+    block_radius). Buffer zones are treated as circles reaching the
+    block radius plus the buffer distance from the centroid.
+
+    Applications are swept in order of start time. Only those whose 36-hour
+    window is still open are kept, in a grid of cells at least as wide as
+    the largest possible overlap distance, so each application is only
+    compared with applications in its own and adjacent cells.
+    '''
+    parent = list(range(len(apps)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        parent[find(i)] = find(j)
+
+    for group in groups:
+        for i in group[1:]:
+            union(i, group[0])
+
+    reach = [block_radius(a) + b for a, b in zip(apps, buffers)]
+    size = 2 * max(reach, default=0) or 1
+
+    def cell(i):
+        return (math.floor(apps[i].x / size),
+                math.floor(apps[i].y / size))
+
+    active = collections.defaultdict(set)
+    expiry = []  # Heap of (close of 36-hour window, index)
+    for i in sorted(range(len(apps)), key=lambda i: apps[i].start):
+        start = apps[i].start
+        while expiry and expiry[0][0] < start:
+            _, j = heapq.heappop(expiry)
+            active[cell(j)].discard(j)
+        cx, cy = cell(i)
+        for dx, dy in itertools.product((-1, 0, 1), repeat=2):
+            for j in active.get((cx + dx, cy + dy), ()):
+                distance = math.hypot(apps[i].x - apps[j].x,
+                                      apps[i].y - apps[j].y)
+                if distance <= reach[i] + reach[j]:
+                    union(i, j)
+        active[(cx, cy)].add(i)
+        heapq.heappush(expiry, (apps[i].end + overlap_window, i))
+
+    components = collections.defaultdict(list)
+    for i in range(len(apps)):
+        components[find(i)].append(i)
+    return list(components.values())
+
+
+def solve_overlaps(county, applications, stats=None, lookup=None):
+    '''Find groups of overlapping applications (see overlap_groups) and
+    calculate their buffer zones, in place of rerunning main by hand for
+    each group. Recalculated buffers are usually larger and may create new
+    overlaps, so grouping and recalculation repeat until no groups change.
+    Groups only ever merge, so this takes at most len(applications) rounds.
+
+    Returns a list of (apps, results) pairs, one per group, where results
+    is the output of main for that group, or the AppkError it raised. An
+    application that cannot be calculated on its own is returned alone
+    with its error and left out of grouping. A group whose recalculation
+    fails keeps its members' earlier buffers for further grouping. Each
+    call of main is recorded in stats, if given, and looks up tables in
+    lookup (see main).'''
+    failed = []  # (apps, error) for applications failing on their own
+    live = []  # Applications with a buffer, to be grouped
+    buffers = []
+    solved = {}  # Group (as a tuple of indices into live) to its outcome
+    for app in applications:
+        try:
+            results = main(False, county, [app], stats=stats, lookup=lookup)
+        except AppkError as e:
+            failed.append(([app], e))
+            continue
+        solved[(len(live),)] = results
+        buffers.append(app_results([app], results)[0].buffer)
+        live.append(app)
+
+    groups = [[i] for i in range(len(live))]
+    while True:
+        merged = overlap_groups(live, buffers, groups)
+        if len(merged) == len(groups):
+            break
+        groups = merged
+        for group in groups:
+            if tuple(group) in solved:
+                continue
+            apps = [live[i] for i in group]
+            try:
+                solved[tuple(group)] = results = main(
+                    True, county, apps, stats=stats, lookup=lookup)
+            except AppkError as e:
+                solved[tuple(group)] = e
+                continue
+            for i, result in zip(group, app_results(apps, results)):
+                buffers[i] = result.buffer
+
+    return failed + [([live[i] for i in group], solved[tuple(group)])
+                     for group in groups]
+
 
-    tif_buffers = [calculate_buffer(app, *args_cb) for app in tif_apps
-        ] if tif_apps else []
+class PrefixIndex:
+    '''Sorted index of a list of choices, built once, for checking typed
+    input against the choices and listing the choices it could complete
+    to. The choices starting with a prefix are a contiguous run of the
+    sorted choices, found by bisection.'''
+    def __init__(self, choices):
+        self.choices = list(choices)
+        self._set = frozenset(self.choices)
+        self._order = sorted(range(len(self.choices)),
+                             key=self.choices.__getitem__)
+        self._sorted = [self.choices[i] for i in self._order]
 
-    if other_apps and not recalc:
-        other_buffers = [calculate_buffer(app, *args_cb) for app in other_apps]
-    elif other_apps and recalc:
-        other_apps, other_buffers = recalculate(other_apps, args_cb)
+    def _range(self, prefix):
+        '''Return the (start, stop) of the sorted choices starting with
+        prefix'''
+        start = bisect.bisect_left(self._sorted, prefix)
+        stop = bisect.bisect_right(self._sorted, prefix + '\U0010ffff', start)
+        return start, stop
+
+    def __contains__(self, choice):
+        return choice in self._set
+
+    def is_prefix(self, prefix):
+        '''Whether any choice starts with prefix'''
+        start, stop = self._range(prefix)
+        return not prefix or start < stop
+
+    def completions(self, prefix):
+        '''Return the choices starting with prefix, in their original
+        order. Every choice starts with an empty prefix, so then `choices`
+        itself is returned.'''
+        if not prefix:
+            return self.choices
+        start, stop = self._range(prefix)
+        return [self.choices[i] for i in sorted(self._order[start:stop])]
+
+
+Product = collections.namedtuple(
+    'Product', ['regno', 'name', 'percent', 'density'])
+Product.__doc__ = '''A row of the products sheet: registration number,
+product name, percent chloropicrin and density (lb/gallon)'''
+
+
+class ProductRegistry:
+    '''Products indexed by registration number, in products-sheet order.
+    Shared by the GUI and the batch mode, so resolving a registration number
+    is a single dict lookup. `regnos` is a PrefixIndex of the registration
+    numbers. Each product's conversion factor for each of the Units is
+    computed once, here (see factor).'''
+    def __init__(self, products):
+        self._products = collections.OrderedDict(
+            (p.regno, p) for p in products)
+        self.regnos = PrefixIndex(self._products)
+        self._factors = {
+            p.regno: tuple(conversion_factor(p.percent, p.density, units)
+                           for units in Units)
+            for p in self._products.values()}
+
+    def __getitem__(self, regno):
+        return self._products[regno]
+
+    def __contains__(self, regno):
+        return regno in self._products
+
+    def __iter__(self):
+        return iter(self._products.values())
+
+    def __len__(self):
+        return len(self._products)
+
+    def get(self, regno, default=None):
+        return self._products.get(regno, default)
+
+    def factor(self, regno, units):
+        '''Return lbs AI per unit of rate of a product, for rates in the
+        given units (see conversion_factor)'''
+        return self._factors[regno][parse_units(units)]
+
+    def with_prefix(self, prefix):
+        '''Return registration numbers starting with prefix, in
+        products-sheet order'''
+        return self.regnos.completions(prefix)
+
+
+def read_products(path=None):
+    '''Read the products sheet into a ProductRegistry. Without a path,
+    products come from the compiled tables file if one is in use (see
+    TableRegistry), else from the bundled products sheet.'''
+    if path is None:
+        compiled = tables.compiled()
+        if compiled:
+            return compiled.products()
+        path = os.path.join(base_path(), 'chloropicrin_products.csv')
+    with open(path, newline='') as csvfile:
+        return ProductRegistry(
+            Product(
+                row['SHOW_REGNO'],
+                row['PRODUCT_NAME'],
+                float(row['PRODCHEM_PCT']),
+                float(row['Density (lb/gallon)']))
+            for row in csv.DictReader(csvfile)
+            if all(row.values()))  # Omit empty rows at bottom of csv files
+
+
+batch_fields = (
+    'number', 'county', 'regno', 'name', 'method', 'broadcast', 'block',
+    'buffer', 'table', 'group', 'error', 'message')
+
+
+class InvalidRecord(dict):
+    '''Record that cannot be calculated, for a reason found before it is
+    resolved: a JSON Lines line that is not a JSON object, or a record
+    separated from the rest of its overlapping group. It holds what fields
+    are known and is reported in an error row (see resolve_record) rather
+    than stopping the run.'''
+    def __init__(self, reason, fields=()):
+        super().__init__(fields)
+        self.reason = reason
+
+
+def read_records(stream, fmt):
+    '''Yield application records one at a time from a CSV or JSON Lines
+    stream. Lines that are not JSON objects are yielded as
+    InvalidRecord.'''
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield InvalidRecord('is not valid JSON ({})'.format(e))
+                continue
+            if isinstance(record, dict):
+                yield record
+            else:
+                yield InvalidRecord('is not a JSON object')
+
+
+def resolve_record(record, products, number):
+    '''Convert a batch record into an Application for main, filling in
+    product details from its registration number'''
+    def number_field(key, default=None):
+        value = record.get(key)
+        if value in (None, ''):
+            if default is None:
+                raise InvalidInputError(
+                    'Application {} is missing {}.'.format(number, key),
+                    number=number)
+            return default
+        try:
+            number_value = float(value)
+        except (ValueError, TypeError):
+            raise InvalidInputError(
+                'Application {} has a non-numeric {} ({}).'.format(
+                    number, key, value),
+                number=number)
+        if not number_value > 0:  # Also rejects NaN
+            raise InvalidInputError(
+                'Application {} has a {} that is not positive ({}).'.format(
+                    number, key, value),
+                number=number)
+        return number_value
+
+    if isinstance(record, InvalidRecord):
+        raise InvalidInputError(
+            'Application {} {}.'.format(number, record.reason),
+            number=number)
+
+    county = str(record.get('county', '')).strip().lower()
+    if county not in county_types:
+        raise InvalidInputError(
+            'Application {} has an unknown county ({}).'.format(
+                number, record.get('county')),
+            number=number)
+    method = str(record.get('method', '')).strip().lower()
+    if method not in valid_methods:
+        raise InvalidInputError(
+            'Application {} has an unknown application method ({}).'.format(
+                number, record.get('method')),
+            number=number)
+    regno = str(record.get('regno', '')).strip()
+    try:
+        product = products[regno]
+    except KeyError:
+        raise InvalidInputError(
+            'Application {} has an unknown registration number ({}).'.format(
+                number, regno),
+            number=number)
+
+    broad_opt = str(record.get('broad_opt', '')).strip().lower() in (
+        '1', 'true', 'yes')
+    try:
+        units = parse_units(str(record.get('units', '')).strip())
+    except ValueError:
+        raise InvalidInputError(
+            'Application {} has unknown units ({}). Units must be one of: '
+            '{}.'.format(number, record.get('units'),
+                         ', '.join(units_labels)),
+            number=number)
+    return Application(
+        number=number,
+        county=county,
+        regno=regno,
+        name=product.name,
+        percent=product.percent,
+        density=product.density,
+        method=method,
+        units=units,
+        factor=products.factor(regno, units),
+        rate=number_field('rate'),
+        block=number_field('block'),
+        strip=number_field('strip', 1) if broad_opt else number_field(
+            'strip'),
+        center=number_field('center', 1) if broad_opt else number_field(
+            'center'),
+        broad_opt=broad_opt,
+        date=str(record.get('date') or '').strip() or None)
+
+
+def group_records(records, recalc=False):
+    '''Number records and split them into units of work. Yields
+    (overlap, group) pairs, where group is a list of (number, record). If
+    recalc is set, consecutive records sharing a county and `group` form
+    one overlapping group; every other record is a group of its own.
+    Records of a group that reappears after other records are each yielded
+    alone as an InvalidRecord, as calculating them apart from the rest of
+    their group would understate its buffer zones.'''
+    def group_key(item):
+        number, record = item
+        if recalc and record.get('group') not in (None, ''):
+            return True, record.get('county'), record['group']
+        return False, number  # Calculate ungrouped records individually
+
+    numbered = (
+        (record.get('number') or i + 1, record)
+        for i, record in enumerate(records))
+    closed = set()  # Overlapping groups already yielded, by str(key)
+    for key, group in itertools.groupby(numbered, key=group_key):
+        if key[0] and str(key) in closed:
+            for number, record in group:
+                yield False, [(number, InvalidRecord(
+                    'is in group {} of {}, which ended before it; records '
+                    'of an overlapping group must be consecutive'.format(
+                        key[2], key[1]),
+                    record))]
+            continue
+        if key[0]:
+            closed.add(str(key))
+        yield key[0], list(group)
+
+
+def error_row(record, number, error):
+    '''Batch result for a record that could not be calculated'''
+    return {
+        'number': number,
+        'county': record.get('county'),
+        'regno': record.get('regno'),
+        'method': record.get('method'),
+        'group': record.get('group'),
+        'error': type(error).__name__,
+        'message': str(error)}
+
+
+def result_row(app, result, group=None):
+    '''Batch result for an application, given the result holding its
+    buffer (see app_results)'''
+    return {
+        'number': app.number,
+        'county': app.county,
+        'regno': app.regno,
+        'name': app.name,
+        'method': result.method,
+        'broadcast': result.broadcast,
+        'block': result.block,
+        'buffer': result.buffer,
+        'table': table_file(result.method, result.county_type),
+        'group': group}
+
+
+def run_group(overlap, group, products, stats=None, lookup=None):
+    '''Calculate buffer zones for one group from group_records, returning
+    one result per record. Errors are reported in the results rather than
+    raised.'''
+    try:
+        apps = [resolve_record(r, products, n) for n, r in group]
+        results = main(overlap, apps[0].county, apps, stats=stats,
+                       lookup=lookup)
+    except AppkError as e:
+        return [error_row(record, number, e) for number, record in group]
+
+    return [
+        result_row(app, result, record.get('group'))
+        for app, result, (_, record) in zip(
+            apps, app_results(apps, results), group)]
+
+
+def run_overlaps(records, products, stats=None, lookup=None):
+    '''Calculate buffer zones for records with application times and
+    locations, detecting groups of overlapping applications with
+    solve_overlaps. Applications in different counties, on either side of a
+    county line, can overlap, so all are grouped together. Each record also needs 'start' and 'end' times
+    (yyyy-mm-dd HH:MM) and block centroid 'x' and 'y' in feet, and may give
+    a block 'radius' in feet. Unlike run_records, every record is read into
+    memory. A record that cannot be calculated on its own is reported as an
+    error and left out of grouping, and a group whose recalculation fails
+    is reported as errors for that group's records only.
+
+    Returns one result per record, in input order. Results in the same
+    overlapping group share a 'group' number.'''
+    def locate(app, record):
+        try:
+            for key in ('start', 'end'):
+                setattr(app, key, datetime.datetime.strptime(
+                    str(record.get(key)), '%Y-%m-%d %H:%M'))
+            app.x, app.y = float(record['x']), float(record['y'])
+            if record.get('radius') not in (None, ''):
+                app.radius = float(record['radius'])
+        except (KeyError, ValueError, TypeError):
+            raise InvalidInputError(
+                'Application {} needs start and end times (yyyy-mm-dd HH:MM) '
+                'and numeric x and y coordinates.'.format(app.number),
+                number=app.number)
+        return app
+
+    results = []
+    apps = []
+    positions = {}  # id(app) to the position of its result
+    for i, record in enumerate(records):
+        number = record.get('number') or i + 1
+        try:
+            app = locate(resolve_record(record, products, number), record)
+        except AppkError as e:
+            results.append(error_row(record, number, e))
+            continue
+        positions[id(app)] = len(results)
+        apps.append(app)
+        results.append(record)
+
+    labels = itertools.count(1)
+    # Every application has its own county, so main needs no default county
+    for group, outcome in solve_overlaps(None, apps, stats, lookup):
+        failed = isinstance(outcome, AppkError)
+        label = None
+        if len(group) > 1 or not failed:  # Not failed on its own
+            label = next(labels)
+        if failed:
+            for app in group:
+                pos = positions[id(app)]
+                results[pos] = error_row(results[pos], app.number, outcome)
+                results[pos]['group'] = label
+            continue
+        for app, result in zip(group, app_results(group, outcome)):
+            results[positions[id(app)]] = result_row(app, result, label)
+    return results
+
+
+def run_records(records, products, recalc=False, stats=None, lookup=None):
+    '''Calculate buffer zones for a stream of records, yielding one result
+    per record in input order. Only one group from group_records is held in
+    memory at a time. Calls of main are recorded in stats, if given, and
+    look up tables in lookup (see main).'''
+    for overlap, group in group_records(records, recalc):
+        yield from run_group(overlap, group, products, stats, lookup)
+
+
+_worker = {}  # Per-process state of run_records_parallel's workers
+
+
+def _init_worker(products, tables_dir, collect_stats, table_root,
+                 table_version):
+    _worker['products'] = products
+    _worker['collect_stats'] = collect_stats
+    _worker['lookup'] = None
+    tables.invalidate(tables_dir)
+    if table_root:
+        table_sets.rescan(table_root)
+        if table_version:
+            table_sets.activate(table_version)
+        _worker['lookup'] = table_sets
+
+
+def _run_chunk(chunk):
+    stats = Stats() if _worker['collect_stats'] else None
+    results = [
+        result for overlap, group in chunk
+        for result in run_group(overlap, group, _worker['products'], stats,
+                                _worker['lookup'])]
+    return results, stats and stats.as_dict()
+
+
+def run_records_parallel(records, products, recalc=False, workers=None,
+                         chunksize=1000, stats=None, lookup=None):
+    '''Like run_records, but spreads the calculation over a pool of worker
+    processes. Records are sent to workers in chunks of about `chunksize`
+    consecutive records, never splitting an overlapping group. Each worker
+    reads the tables once and keeps them for the rest of the run. Results
+    are yielded in input order, and only a few chunks per worker are in
+    flight at a time, so memory stays bounded for any input size. If given
+    a Stats, the workers' stats are merged into it as chunks finish. A
+    TableSets lookup is rescanned in each worker, from the same root and
+    with the same active set.'''
+    def finish(pending):
+        results, chunk_stats = pending.popleft().get()
+        if stats is not None:
+            stats.merge(chunk_stats)
+        return results
+
+    def chunks():
+        chunk, size = [], 0
+        for overlap, group in group_records(records, recalc):
+            chunk.append((overlap, group))
+            size += len(group)
+            if size >= chunksize:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+
+    workers = workers or os.cpu_count() or 1
+    sets = lookup if isinstance(lookup, TableSets) else None
+    pool = multiprocessing.Pool(
+        workers, initializer=_init_worker,
+        initargs=(products, tables.tables_dir, stats is not None,
+                  sets and sets.root, sets and sets.active))
+    try:
+        pending = collections.deque()
+        for chunk in chunks():
+            pending.append(pool.apply_async(_run_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield from finish(pending)
+        while pending:
+            yield from finish(pending)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_records(results, stream, fmt):
+    '''Write results to a stream as they are produced'''
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=batch_fields,
+                                lineterminator='\n')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
     else:
-        other_buffers = []
+        for result in results:
+            stream.write(json.dumps(result) + '\n')
+
+
+def cli(argv=None):
+    '''Command-line batch mode. Reads application records from a CSV or
+    JSON Lines file (or stdin) and writes one result per record.'''
+    def guess_format(path, default='csv'):
+        if path and path != '-':
+            ext = os.path.splitext(path)[1].lower()
+            if ext in ('.jsonl', '.json'):
+                return 'jsonl'
+            if ext == '.csv':
+                return 'csv'
+        return default
+
+    parser = argparse.ArgumentParser(
+        description=(
+            'Calculate Appendix K buffer zones for a batch of applications. '
+            'Each record needs county, regno, method, rate, units, block, '
+            'strip and center fields. Optional fields are number, broad_opt '
+            '(direct input of broadcast-equivalent rate; strip and center '
+            'may then be omitted) and group (see --recalc).'))
+    parser.add_argument('input', nargs='?', default='-',
+                        help='input file (default: stdin)')
+    parser.add_argument('-o', '--output', default='-',
+                        help='output file (default: stdout)')
+    parser.add_argument('--input-format', choices=('csv', 'jsonl'),
+                        help='default: guessed from file extension, else csv')
+    parser.add_argument('--output-format', choices=('csv', 'jsonl'),
+                        help='default: same as input format')
+    parser.add_argument('--recalc', action='store_true',
+                        help='calculate consecutive records with the same '
+                             'county and group as overlapping applications')
+    parser.add_argument('--detect-overlaps', action='store_true',
+                        help='find groups of overlapping applications from '
+                             'start, end, x and y fields (see run_overlaps); '
+                             'reads the whole input into memory')
+    parser.add_argument('--products',
+                        help='products sheet (default: bundled '
+                             'chloropicrin_products.csv)')
+    parser.add_argument('--tables', help='Appendix K tables directory')
+    parser.add_argument('--table-root',
+                        help='directory of dated table sets, such as '
+                             'Tables/112017 (see TableSets); each record is '
+                             'calculated with the set in force on its date '
+                             'field, if given')
+    parser.add_argument('--table-version',
+                        help='with --table-root, the table set for records '
+                             'without a date (default: the newest)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes; 0 uses every CPU '
+                             '(default: 1)')
+    parser.add_argument('--compile', metavar='OUT',
+                        help='compile the tables and products sheet into a '
+                             'binary tables file OUT, then exit')
+    parser.add_argument('--chunksize', type=int, default=1000,
+                        help='records sent to a worker at a time '
+                             '(default: 1000)')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the time spent in each stage of the '
+                             'calculation to stderr when done')
+    args = parser.parse_args(argv)
+
+    if args.compile:
+        compile_tables(args.compile, args.tables, args.products)
+        return
+
+    in_fmt = args.input_format or guess_format(args.input)
+    out_fmt = args.output_format or guess_format(args.output, in_fmt)
+    if args.tables:
+        tables.invalidate(args.tables)
+    lookup = None
+    if args.table_root:
+        lookup = table_sets
+        if not table_sets.rescan(args.table_root):
+            parser.error('no table sets in {}'.format(args.table_root))
+        if args.table_version:
+            table_sets.activate(args.table_version)
+    products = read_products(args.products)
+
+    with contextlib.ExitStack() as stack:
+        if args.input == '-':
+            instream = sys.stdin
+        else:
+            instream = stack.enter_context(open(args.input, newline=''))
+        if args.output == '-':
+            outstream = sys.stdout
+        else:
+            outstream = stack.enter_context(
+                open(args.output, 'w', newline=''))
+        records = read_records(instream, in_fmt)
+        stats = Stats() if args.stats else None
+        if args.detect_overlaps:
+            results = run_overlaps(records, products, stats, lookup)
+        elif args.workers == 1:
+            results = run_records(records, products, args.recalc, stats,
+                                  lookup)
+        else:
+            results = run_records_parallel(
+                records, products, args.recalc, args.workers or None,
+                args.chunksize, stats, lookup)
+        write_records(results, outstream, out_fmt)
+    if stats is not None:
+        sys.stderr.write(stats.summary() + '\n')
 
-    apps, buffers = tif_apps + other_apps, tif_buffers + other_buffers
-    for i,app in enumerate(apps):
-        app['buffer'] = buffers[i]
 
-    return apps
+if __name__ == '__main__':
+    cli()
 
 ##### More info on... #####
 # Defaultdicts:
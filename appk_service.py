@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018, California Department of Pesticide Regulation, All rights
+reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+   may be used to endorse or promote products derived from this software
+   without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+# Local HTTP/JSON service for buffer-zone calculations, for use by other
+# programs on the same machine. Tables and products are loaded once at
+# startup and kept in memory. Run with:
+#
+#     python appk_service.py [--port 8712] [--table-root Tables]
+#
+# Endpoints (request and response bodies are JSON):
+#
+#     POST /calculate   {"applications": [record, ...], "recalc": false}
+#     POST /overlaps    {"applications": [record, ...]}
+#         Records and results are those of appk's batch mode (see
+#         appk.resolve_record, appk.run_records and appk.run_overlaps).
+#         Responds {"results": [result, ...]}, one result per record.
+#     GET  /health      Table sets and products loaded
+#     GET  /stats       Stage timings and counts (see appk.Stats)
+#     POST /tables/rescan               With --table-root, find new sets
+#     POST /tables/activate {"version": name}   Swap the active table set
+
+import argparse
+import json
+import queue
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import appk
+
+
+class Job:
+    '''One request's calculation, waiting for the batcher'''
+    __slots__ = ('kind', 'records', 'recalc', 'results', 'error', 'done')
+
+    def __init__(self, kind, records, recalc=False):
+        self.kind = kind
+        self.records = records
+        self.recalc = recalc
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Batcher:
+    '''Runs the calculations of concurrent requests together. Jobs arriving
+    within max_wait seconds of the first (up to max_batch jobs) form a
+    batch, calculated in turn by one thread. Groups of records that are
+    identical (as JSON) within a batch are calculated once; nothing else is
+    shared, and waiting for a batch adds up to max_wait to each request.'''
+    def __init__(self, products, lookup=None, max_wait=0.002, max_batch=256):
+        self.products = products
+        self.lookup = lookup
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.stats = appk.Stats()
+        self.batches = 0
+        self.shared = 0  # Groups answered from an identical one in a batch
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        '''Queue a job and wait for its results'''
+        self._jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.results
+
+    def _run(self):
+        while True:
+            jobs = [self._jobs.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(jobs)
+
+    def _run_batch(self, jobs):
+        self.batches += 1
+        groups = {}  # Group, as JSON, to its results
+        for job in jobs:
+            try:
+                if job.kind == 'overlaps':
+                    job.results = appk.run_overlaps(
+                        job.records, self.products, self.stats, self.lookup)
+                    continue
+                results = []
+                for overlap, group in appk.group_records(job.records,
+                                                         job.recalc):
+                    key = json.dumps([overlap, group], sort_keys=True,
+                                     default=str)
+                    if key in groups:
+                        self.shared += 1
+                    else:
+                        groups[key] = appk.run_group(
+                            overlap, group, self.products, self.stats,
+                            self.lookup)
+                    results.extend(groups[key])
+                job.results = results
+            except Exception as e:  # Reported to the job's request
+                job.error = e
+            finally:
+                job.done.set()
+
+
+class ServiceError(Exception):
+    '''Error in a request, reported with an HTTP status'''
+    def __init__(self, status, msg):
+        super().__init__(msg)
+        self.status = status
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''Routes requests to the service (self.server.service)'''
+    protocol_version = 'HTTP/1.1'  # Keep connections alive between calls
+
+    def do_GET(self):
+        self._respond(self.server.service.get)
+
+    def do_POST(self):
+        self._respond(self.server.service.post)
+
+    def _respond(self, method):
+        try:
+            body = None
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                try:
+                    body = json.loads(self.rfile.read(length).decode('utf-8'))
+                except ValueError:
+                    raise ServiceError(400, 'Request body is not valid JSON.')
+                if not isinstance(body, dict):
+                    raise ServiceError(
+                        400, 'Request body is not a JSON object.')
+            status, response = 200, method(self.path, body)
+        except ServiceError as e:
+            status, response = e.status, {'error': str(e)}
+        except Exception as e:
+            status, response = 500, {
+                'error': '{}: {}'.format(type(e).__name__, e)}
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Bursts of new connections
+
+
+class Service:
+    '''The calculator behind the HTTP endpoints. Loads every table and the
+    products when created, so requests never wait on disk.'''
+    def __init__(self, products_path=None, table_root=None,
+                 table_version=None, max_wait=0.002):
+        self.lookup = None
+        if table_root:
+            self.lookup = appk.table_sets
+            if not appk.table_sets.rescan(table_root):
+                raise ValueError('No table sets in {}.'.format(table_root))
+            if table_version:
+                appk.table_sets.activate(table_version)
+        self.products = appk.read_products(products_path)
+        self.warm()
+        self.batcher = Batcher(self.products, self.lookup, max_wait)
+
+    def registries(self):
+        '''(name, TableRegistry) for each set of tables in use'''
+        if self.lookup is None:
+            return [('tables', appk.tables)]
+        return [(name, self.lookup.registry(name))
+                for name in self.lookup.versions()]
+
+    def warm(self):
+        '''Load every table of the tables in use'''
+        for _, registry in self.registries():
+            for county_type, method in appk.table_info:
+                registry.get(method, county_type)
+
+    def get(self, path, body):
+        if path == '/health':
+            return {
+                'status': 'ok',
+                'products': len(self.products),
+                'table_sets': self.lookup.versions() if self.lookup else None,
+                'active': self.lookup.active if self.lookup else None}
+        if path == '/stats':
+            return {
+                'stages': self.batcher.stats.as_dict(),
+                'batches': self.batcher.batches,
+                'shared_groups': self.batcher.shared,
+                'cache': {name: registry.cache.stats()
+                          for name, registry in self.registries()}}
+        raise ServiceError(404, 'Unknown path {}.'.format(path))
+
+    def post(self, path, body):
+        if path in ('/calculate', '/overlaps'):
+            records = (body or {}).get('applications')
+            if not isinstance(records, list) or not all(
+                    isinstance(r, dict) for r in records):
+                raise ServiceError(
+                    400, 'Request needs a list of applications.')
+            job = Job(path[1:], records, bool(body.get('recalc')))
+            return {'results': self.batcher.submit(job)}
+        if path == '/tables/rescan':
+            if self.lookup is None:
+                raise ServiceError(400, 'The service has no --table-root.')
+            self.lookup.rescan()
+            self.warm()
+            return {'table_sets': self.lookup.versions(),
+                    'active': self.lookup.active}
+        if path == '/tables/activate':
+            if self.lookup is None:
+                raise ServiceError(400, 'The service has no --table-root.')
+            try:
+                self.lookup.activate((body or {}).get('version'))
+            except ValueError as e:
+                raise ServiceError(400, str(e))
+            return {'active': self.lookup.active}
+        raise ServiceError(404, 'Unknown path {}.'.format(path))
+
+
+def serve(service, host='127.0.0.1', port=8712, verbose=False):
+    '''Return an HTTP server for a Service (call serve_forever to run it)'''
+    server = Server((host, port), Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve appk buffer-zone calculations over HTTP/JSON.')
+    parser.add_argument('--host', default='127.0.0.1',
+        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8712,
+        help='port to listen on (default: 8712)')
+    parser.add_argument('--products',
+        help='products sheet (default: bundled chloropicrin_products.csv)')
+    parser.add_argument('--tables', help='Appendix K tables directory')
+    parser.add_argument('--table-root',
+        help='directory of dated table sets (see appk.TableSets)')
+    parser.add_argument('--table-version',
+        help='with --table-root, the table set for applications without a '
+             'date (default: the newest)')
+    parser.add_argument('--max-wait', type=float, default=2,
+        help='milliseconds to gather concurrent requests into a batch '
+             '(default: 2)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+        help='log each request to stderr')
+    args = parser.parse_args()
+
+    if args.tables:
+        appk.tables.invalidate(args.tables)
+    service = Service(args.products, args.table_root, args.table_version,
+                      args.max_wait / 1000)
+    server = serve(service, args.host, args.port, args.verbose)
+    sys.stderr.write('Serving on http://{}:{}\n'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
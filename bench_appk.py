@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018, California Department of Pesticide Regulation, All rights
+reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+   may be used to endorse or promote products derived from this software
+   without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+# Benchmarks of appk's hot paths on synthetic workloads. Stand-in tables with
+# the shape of the Appendix K tables are generated in a temporary directory,
+# so no table data is needed. Results are written as JSON, which can be
+# compared against an earlier run:
+#
+#     python bench_appk.py -o before.json
+#     python bench_appk.py -o after.json --compare before.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import appk
+
+table_rates = list(range(10, 360, 10))  # lbs AI/acre
+table_acreage = [1, 2, 5, 10, 15, 20, 30, 40, 60]
+products = [  # (regno, name, percent, density)
+    ('5785-41', 'PIC-CLOR 60', 59.6, 11.2),
+    ('11220-10', 'TRI-CLOR', 99.0, 13.9),
+    ('8536-13-58266', 'CHLOROPICRIN 100', 99.4, 13.9)]
+counties = {'coastal': 'monterey', 'inland': 'fresno'}
+units = ('lbs product / treated acre', 'gal product / treated acre')
+default_sizes = (1, 100, 10000, 1000000)
+
+
+def write_tables(tables_dir):
+    '''Write stand-in tables for every Appendix K table file. Buffers grow
+    with rate and acreage, and the cells for the largest rate and block
+    sizes are NA (buffer over half a mile), as in the real tables.'''
+    for n, filename in enumerate(sorted(set(appk.coastal_csv +
+                                            appk.inland_csv))):
+        with open(os.path.join(tables_dir, filename), 'w') as f:
+            f.write(','.join(['Rate'] + [str(a) for a in table_acreage]))
+            f.write('\n')
+            for i, rate in enumerate(table_rates):
+                row = [str(rate)]
+                for j, _ in enumerate(table_acreage):
+                    if i == len(table_rates) - 1 and j >= len(table_acreage)-2:
+                        row.append('NA ')
+                    else:
+                        row.append(str(25 + 5*n + 30*i + 40*j))
+                f.write(','.join(row) + '\n')
+
+
+def make_application(rng, number, methods, max_block):
+    '''Return a random application that the stand-in tables can look up'''
+    regno, name, percent, density = rng.choice(products)
+    broadcast = rng.uniform(5, table_rates[-2])
+    app = dict(number=number, regno=regno, name=name, percent=percent,
+               density=density, method=rng.choice(methods),
+               units=rng.choice(units), block=rng.uniform(0.5, max_block),
+               broad_opt=rng.random() < 0.25)
+    per_unit = percent / 100 * (density if app['units'] == units[1] else 1)
+    if app['broad_opt']:
+        app['rate'] = broadcast / per_unit
+    else:
+        app['center'] = float(rng.choice((30, 40, 48, 60)))
+        app['strip'] = app['center'] * rng.uniform(0.3, 1)
+        app['rate'] = broadcast / per_unit * app['center'] / app['strip']
+    app['factor'] = appk.conversion_factor(percent, density, app['units'])
+    return appk.Application(**app)
+
+
+def make_applications(size, seed=0):
+    '''Random applications across all permitted methods'''
+    rng = random.Random(seed)
+    return [make_application(rng, i+1, appk.app_methods[1:], 40)
+            for i in range(size)]
+
+
+def make_groups(size, seed=0, group_size=4):
+    '''Random groups of overlapping non-TIF/untarped applications, with at
+    most size applications in all'''
+    rng = random.Random(seed)
+    methods = appk.app_methods[5:]
+    apps = [make_application(rng, i+1, methods, 40 / group_size)
+            for i in range(size)]
+    return [apps[i:i+group_size] for i in range(0, size, group_size)]
+
+
+def measure(fn, repeats, setup=None):
+    '''Return the times (seconds) of repeated calls of fn'''
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def benchmarks(sizes, county_types):
+    '''Yield (name, county type, size, fn, setup) for each benchmark'''
+    clear_cache = appk.tables.cache.clear
+    ntables = len(appk.app_methods[1:]) * 2
+    yield ('read_tables', 'both', ntables,
+           lambda: appk.read_tables(appk.app_methods[1:]),
+           appk.tables.invalidate)
+    appk.read_tables(appk.app_methods[1:])  # Warm tables for the rest
+
+    for size in sizes:
+        apps = make_applications(size)
+        groups = make_groups(size)
+
+        def broadcast(apps=apps):
+            for app in apps:
+                appk.broadcast_equiv_calc(app)
+        yield ('broadcast_equiv_calc', 'both', size, broadcast, None)
+
+        for county_type in county_types:
+            cb_list = [county_type, appk.tables]
+
+            def calculate(apps=apps, cb_list=cb_list):
+                for app in apps:
+                    appk.calculate_buffer(app, *cb_list)
+
+            def recalculate(groups=groups, cb_list=cb_list):
+                for group in groups:
+                    appk.recalculate(group, cb_list)
+
+            def main(apps=apps, county=counties[county_type]):
+                appk.main(False, county, apps)
+
+            yield ('calculate_buffer', county_type, size, calculate,
+                   clear_cache)
+            yield ('recalculate', county_type, size, recalculate, clear_cache)
+            yield ('main', county_type, size, main, clear_cache)
+
+
+def run(sizes, county_types, repeats):
+    '''Run every benchmark, printing a line for each, and return the
+    results'''
+    results = []
+    for name, county_type, size, fn, setup in benchmarks(sizes,
+                                                         county_types):
+        times = measure(fn, repeats, setup)
+        result = {
+            'name': name, 'county_type': county_type, 'size': size,
+            'repeats': repeats, 'median': statistics.median(times),
+            'min': min(times)}
+        result['per_item'] = result['median'] / size
+        results.append(result)
+        print('{:<22} {:<8} {:>8} median {:10.3f} ms  {:10.3f} us/item'.format(
+            name, county_type, size, result['median'] * 1000,
+            result['per_item'] * 1e6))
+    return results
+
+
+def compare(results, path):
+    '''Print the ratio of each median to that of an earlier run'''
+    with open(path) as f:
+        before = {(r['name'], r['county_type'], r['size']): r
+                  for r in json.load(f)['results']}
+    print('\nCompared with {} (ratio of medians; > 1 is slower):'.format(path))
+    for r in results:
+        old = before.get((r['name'], r['county_type'], r['size']))
+        if old and old['median']:
+            print('{:<22} {:<8} {:>8} {:8.2f}x'.format(
+                r['name'], r['county_type'], r['size'],
+                r['median'] / old['median']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark appk on synthetic tables and applications.')
+    parser.add_argument('-o', '--output', default='bench_appk.json',
+        help='JSON file for the results (default: bench_appk.json)')
+    parser.add_argument('--sizes', default=','.join(map(str, default_sizes)),
+        help='comma-separated numbers of applications (default: {})'.format(
+            ','.join(map(str, default_sizes))))
+    parser.add_argument('--county-types', default='coastal,inland',
+        help='comma-separated county types (default: coastal,inland)')
+    parser.add_argument('--repeats', type=int, default=3,
+        help='timed runs of each benchmark; the median is reported')
+    parser.add_argument('--compare', metavar='JSON',
+        help='results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    county_types = args.county_types.split(',')
+    with tempfile.TemporaryDirectory() as tmp:
+        write_tables(tmp)
+        appk.tables.invalidate(tmp)
+        results = run(sizes, county_types, args.repeats)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'results': results}, f, indent=1)
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018, California Department of Pesticide Regulation, All rights
+reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+   may be used to endorse or promote products derived from this software
+   without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+# Load test for appk_service.py. Sends requests from concurrent clients and
+# reports latency percentiles and throughput, exiting with status 1 if a
+# latency target is missed. By default, a service is started in-process on
+# the stand-in tables of bench_appk.py, so no table data is needed:
+#
+#     python bench_service.py --clients 16 --requests 2000 --p95 50
+#     python bench_service.py --url http://127.0.0.1:8712   # running service
+
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import appk
+import appk_service
+import bench_appk
+
+
+def make_record(rng):
+    '''Random batch record that the stand-in tables can look up'''
+    regno, name, percent, density = rng.choice(bench_appk.products)
+    return {
+        'county': rng.choice(appk.coastal + appk.inland),
+        'regno': regno,
+        'method': rng.choice(appk.app_methods[1:]),
+        'rate': round(rng.uniform(5, bench_appk.table_rates[-2]) /
+                      (percent / 100), 1),
+        'units': 'lbs product / treated acre',
+        'broad_opt': 1,
+        'block': round(rng.uniform(0.5, 40), 1)}
+
+
+def client(url, bodies, latencies, errors):
+    '''Send each request body in turn, recording latencies (seconds)'''
+    for body in bodies:
+        data = json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(
+            url + '/calculate', data=data,
+            headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                json.loads(response.read().decode('utf-8'))
+        except Exception as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def load_test(url, clients, requests, size, seed=0):
+    '''Send `requests` requests of `size` applications each from `clients`
+    threads. Returns (latencies, errors, elapsed seconds).'''
+    rng = random.Random(seed)
+    bodies = [{'applications': [make_record(rng) for _ in range(size)]}
+              for _ in range(requests)]
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=client,
+                         args=(url, bodies[i::clients], latencies, errors))
+        for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def write_products(path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['SHOW_REGNO', 'PRODUCT_NAME', 'PRODCHEM_PCT',
+                         'Density (lb/gallon)'])
+        writer.writerows(bench_appk.products)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Load test appk_service.py.')
+    parser.add_argument('--url',
+        help='URL of a running service (default: start one in-process on '
+             'stand-in tables)')
+    parser.add_argument('--clients', type=int, default=8,
+        help='concurrent clients (default: 8)')
+    parser.add_argument('--requests', type=int, default=1000,
+        help='requests in all (default: 1000)')
+    parser.add_argument('--size', type=int, default=1,
+        help='applications per request (default: 1)')
+    parser.add_argument('--p50', type=float, help='target median, in ms')
+    parser.add_argument('--p95', type=float,
+        help='target 95th percentile, in ms')
+    parser.add_argument('--p99', type=float,
+        help='target 99th percentile, in ms')
+    parser.add_argument('-o', '--output', help='also write results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        url = args.url
+        if not url:
+            bench_appk.write_tables(tmp)
+            appk.tables.invalidate(tmp)
+            products_path = os.path.join(tmp, 'products.csv')
+            write_products(products_path)
+            server = appk_service.serve(
+                appk_service.Service(products_path), port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        latencies, errors, elapsed = load_test(
+            url.rstrip('/'), args.clients, args.requests, args.size)
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    if not latencies:
+        sys.exit('Every request failed: {}'.format(errors[0]))
+    results = {
+        'clients': args.clients, 'requests': args.requests,
+        'size': args.size, 'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99), 'max': max(latencies)}
+    print('{} requests from {} clients, {} errors, {:.0f} requests/s'.format(
+        len(latencies), args.clients, len(errors), results['throughput']))
+    for key in ('mean', 'p50', 'p95', 'p99', 'max'):
+        print('{:<5} {:8.2f} ms'.format(key, results[key] * 1000))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    missed = [
+        '{} {:.2f} ms > {} ms'.format(key, results[key] * 1000, target)
+        for key, target in (('p50', args.p50), ('p95', args.p95),
+                            ('p99', args.p99))
+        if target is not None and results[key] * 1000 > target]
+    if missed or errors:
+        sys.exit('Missed latency targets: ' + ', '.join(missed)
+                 if missed else 'Some requests failed: {}'.format(errors[0]))
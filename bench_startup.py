@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2018, California Department of Pesticide Regulation, All rights
+reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors
+   may be used to endorse or promote products derived from this software
+   without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+# Time table and product loading, and the first calculation, from the CSV
+# files and from a compiled tables file (see appk.compile_tables). Run from
+# the directory containing Tables/ and chloropicrin_products.csv:
+#
+#     python bench_startup.py [repeats]
+
+import os
+import sys
+import tempfile
+import time
+import statistics
+import appk
+
+first_app = {
+    'number': 1, 'method': 'tif drip', 'rate': 100, 'percent': 60,
+    'density': 11.2, 'units': 'lbs product / treated acre', 'broad_opt': 0,
+    'strip': 20, 'center': 60, 'block': 10}
+
+
+def startup(registry, products_path=None):
+    '''Load every table and the products, then calculate one buffer'''
+    if products_path:
+        appk.read_products(products_path)
+    else:
+        registry.compiled().products()
+    for method in appk.app_methods[1:]:
+        for county_type in ('coastal', 'inland'):
+            registry.get(method, county_type)
+    appk.calculate_buffer(appk.Application(**first_app), 'inland', registry)
+
+
+def bench(label, make_registry, products_path, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        registry = make_registry()
+        startup(registry, products_path)
+        times.append(time.perf_counter() - start)
+        if registry.compiled():
+            registry.compiled().close()  # So the file can be deleted
+    print('{:<10} median {:8.3f} ms   min {:8.3f} ms'.format(
+        label, statistics.median(times) * 1000, min(times) * 1000))
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tables_dir = appk.default_tables_dir()
+    products_path = os.path.join(appk.base_path(), 'chloropicrin_products.csv')
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled_path = os.path.join(tmp, 'appk_tables.bin')
+        appk.compile_tables(compiled_path, tables_dir, products_path)
+        bench('csv', lambda: appk.TableRegistry(tables_dir), products_path,
+              repeats)
+        bench('compiled', lambda: appk.TableRegistry(
+            compiled_path=compiled_path), None, repeats)
@@ -32,23 +32,23 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from io import StringIO
 import functools
 import sys
-import contextlib
 import os
-import csv
 import appk
 import datetime
 import re
+import threading
+import queue
+import time
 from collections import namedtuple
-from collections import defaultdict
 from collections import OrderedDict
 from collections import deque
 
 county_msg = (
     'County in which the application(s) take place, chosen from this list of '
-    'options.'
+    'options. Applications in other counties can each be given their own '
+    'county in their application windows.'
 )
 broad_msg = (
     'Broadcast-equivalent application rate, given in pounds or gallons of '
@@ -114,6 +114,10 @@ center_msg = (
 )
 regno_msg = 'Registration number, chosen from this list of options.'
 method_msg = 'Method of application, chosen from this list of options.'
+app_county_msg = (
+    'County in which this application takes place, chosen from this list of '
+    'options. Leave blank if it is the county given on the main window.'
+)
 
 
 def center_top_level(toplevel):
@@ -135,14 +139,33 @@ def center_top_level(toplevel):
 
 
 def validate(choices, P):
-    '''Ensure that entry conforms to predetermined choices'''
+    '''Ensure that entry conforms to predetermined choices (an
+    appk.PrefixIndex)'''
     # Typing and deleting makes for some cool printed console art! :)
     # print(P)
-    for c in choices:
-        if c.startswith(P):
-            return True
-    else:
-        return False
+    return choices.is_prefix(P)
+
+
+def filter_choices(combobox, choices, event=None):
+    '''Limit a combobox's dropdown list to the choices (an appk.PrefixIndex)
+    that complete what has been typed so far. Keys that leave the text as it
+    was (Tab, arrows, Shift, ...) do not refilter.'''
+    text = combobox.get()
+    if text == combobox.filtered_text:
+        return
+    combobox.filtered_text = text
+    combobox.configure(values=choices.completions(text))
+
+
+def make_filtered_combobox(combobox, choices):
+    '''Filter a combobox's dropdown list as the user types. The combobox is
+    created listing all the choices.'''
+    combobox.filtered_text = ''  # Text its dropdown list was filtered for
+    combobox.bind(
+        '<KeyRelease>',
+        functools.partial(filter_choices, combobox, choices)
+    )
+    return combobox
 
 
 def onFrameConfigure(canvas):
@@ -165,20 +188,6 @@ def writeDetailsToFile():
     pass
 
 
-def read_csv(dir, filename):
-    with open(os.path.join(dir, filename), newline='') as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        colnames = next(csvreader)
-        result = defaultdict(list)
-        for c in colnames:  # Initialize defaults (lists)
-            result[c]
-        for row in csvreader:
-            if all(row):  # Omit empty rows at bottom of csv files
-                for i,val in enumerate(row):
-                    result[colnames[i]].append(val)
-        return result
-
-
 def invalid_value(W, warning):
     global root
     widget = root.nametowidget(W)
@@ -201,22 +210,141 @@ def invalid_value(W, warning):
 #     counted.ncalls = 0
 #     return counted
 
-class Capturing(list):
-    '''Capture stdout. The target of the as-clause of a with statement can
-    be passed to subsequent invocations of this context manager.
-    '''
-    def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = StringIO()
-        return self
-    def __exit__(self, *args):
-        self.append(sys.stdout.getvalue())
-        sys.stdout = self._stdout
+class Cancelled(Exception):
+    '''Raised in the calculation thread when the user cancels'''
+
+
+class Progress(tk.Toplevel):
+    '''Window showing the progress of a buffer-zone calculation, with a
+    button to cancel it'''
+    def __init__(self, mainframe, cancel):
+        if sys.platform == 'darwin':  # http://wiki.tcl.tk/44444
+            tk.Toplevel.__init__(self, background='#e6e6e6')
+        else:
+            tk.Toplevel.__init__(self)
+        self.title('Calculating buffer zones')
+        self.transient(mainframe.root)
+        self.protocol('WM_DELETE_WINDOW', cancel)
+
+        self.label = ttk.Label(self, text='Calculating buffer zones...')
+        self.label.grid(row=0, column=0, padx=20, pady=10, sticky='W')
+        self.bar = ttk.Progressbar(self, length=300, mode='determinate')
+        self.bar.grid(row=1, column=0, padx=20)
+        ttk.Button(self, text='Cancel', command=cancel
+        ).grid(row=2, column=0, pady=10)
+        center_top_level(self)
+
+    def update_progress(self, done, total):
+        self.bar.configure(maximum=total, value=done)
+        self.label.configure(
+            text='Calculated buffer zones for {} of {} applications'.format(
+                done, total)
+        )
+
+
+class Results(tk.Toplevel):
+    '''Window listing buffer-zone results in a sortable table.
+
+    Only the rows in view exist as Treeview items; scrolling refills them
+    from the list of results, so the window stays responsive for any number
+    of applications.'''
+    columns = OrderedDict((
+        ('number', ('Application', 90, 'w')),
+        ('product', ('Product', 260, 'w')),
+        ('buffer', ('Buffer zone (feet)', 120, 'e')),
+        ('table', ('Table', 90, 'w')),
+        ('broadcast', ('Broadcast rate (lbs A.I./acre)', 180, 'e')),
+        ('block', ('Block (acres)', 90, 'e')),
+    ))
+    height = 20  # Rows in view
+
+    def __init__(self, mainframe, rows, note=None):
+        if sys.platform == 'darwin':  # http://wiki.tcl.tk/44444
+            tk.Toplevel.__init__(self, background='#e6e6e6')
+        else:
+            tk.Toplevel.__init__(self)
+        self.title('Buffer-zone Determination')
+        self.transient(mainframe.root)
+
+        self.rows = rows
+        self.offset = 0
+        self.sorted_by = None
+        self.reverse = False
+
+        if note:
+            ttk.Label(self, text=note, wraplength=800, justify='left'
+            ).grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky='W')
+
+        self.tree = ttk.Treeview(self, columns=list(self.columns),
+            show='headings', height=self.height, selectmode='browse')
+        for k, (text, width, anchor) in self.columns.items():
+            self.tree.heading(k, text=text,
+                command=functools.partial(self.sort, k))
+            self.tree.column(k, width=width, anchor=anchor)
+        self.items = [self.tree.insert('', 'end')
+                      for _ in range(min(self.height, len(rows)))]
+        self.tree.grid(row=1, column=0, sticky='NSEW')
+
+        self.vsb = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.vsb.grid(row=1, column=1, sticky='NS')
+        self.columnconfigure(0, weight=1)
+
+        # The Treeview itself never has anything to scroll, so wheel and
+        # paging keys are redirected to the list of results
+        for seq in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(seq, self._on_wheel)
+        self.tree.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        self.tree.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+
+        ttk.Label(self, text='{} result{}'.format(
+            len(rows), '' if len(rows) == 1 else 's')
+        ).grid(row=2, column=0, padx=10, sticky='W')
+        ttk.Button(self, text='OK', command=self.destroy
+        ).grid(row=3, column=0, columnspan=2, pady=10)
+
+        self.sort('buffer', reverse=True)
+        center_top_level(self)
+
+    def sort(self, column, reverse=None):
+        '''Sort results by a column. Clicking the sorted column's heading
+        again reverses the order.'''
+        if reverse is None:
+            reverse = not self.reverse if column == self.sorted_by else False
+        i = list(self.columns).index(column)
+        self.rows.sort(key=lambda row: row[0][i], reverse=reverse)
+        self.sorted_by = column
+        self.reverse = reverse
+        self.show(0)
+
+    def show(self, offset):
+        '''Fill the rows in view, starting from result number offset'''
+        page = len(self.items)
+        self.offset = max(0, min(offset, len(self.rows) - page))
+        for item, (_, values) in zip(self.items, self.rows[self.offset:]):
+            self.tree.item(item, values=values)
+        total = len(self.rows) or 1
+        self.vsb.set(self.offset / total, (self.offset + page) / total)
+
+    def yview(self, *args):
+        '''Scrollbar command: ('moveto', fraction) or
+        ('scroll', n, 'units' or 'pages')'''
+        if args[0] == 'moveto':
+            self.show(int(float(args[1]) * len(self.rows)))
+        else:
+            step = len(self.items) if args[2] == 'pages' else 1
+            self.show(self.offset + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview('scroll', -3, 'units')
+        else:
+            self.yview('scroll', 3, 'units')
+        return 'break'
 
 
 class MainFrame(ttk.Frame):
     '''Main application window'''
-    counties = sorted(appk.coastal + appk.inland)
+    counties = appk.PrefixIndex(sorted(appk.coastal + appk.inland))
     main_text = (
         'Date of determination:',
         'Permittee name:',
@@ -236,7 +364,8 @@ class MainFrame(ttk.Frame):
                 'strip',
                 'center',
                 'regno',
-                'method'
+                'method',
+                'county'
             ),
             (
                 'Directly input broadcast-equivalent application rate:',
@@ -246,16 +375,23 @@ class MainFrame(ttk.Frame):
                 'Strip or bed-bottom width (inches):',
                 'Center-to-center row spacing (inches):',
                 'Registration number:',
-                'Application method:'
+                'Application method:',
+                'County (if not the one above):'
             )
         )
     )
 
+    broad_rate_text = 'Broadcast-equivalent application rate:'
+    summary_width = 260  # Pixels for the labels in the list of applications
+
+    poll_ms = 50  # How often to check on a running calculation
+    progress_delay = 0.3  # Seconds before showing a progress window
+
     try:  # http://effbot.org/pyfaq/why-do-my-tkinter-images-not-appear.htm
         base_path = sys._MEIPASS
     except:
         base_path = os.getcwd()
-    products = read_csv(base_path, 'chloropicrin_products.csv')
+    products = appk.read_products()
 
     def __init__(self, parent, *args, **kwargs):
         '''https://stackoverflow.com/questions/4140437/interactively-
@@ -317,12 +453,15 @@ class MainFrame(ttk.Frame):
         # Create and position mainframe county combobox
         vcmd = (self.register(validate_county), '%P')
         invcmd = (self.register(invalid_county), '%W')
-        self.county = ttk.Combobox(
-            self,
-            values=self.counties,
-            validate='focusout',
-            validatecommand=vcmd,
-            invalidcommand=invcmd
+        self.county = make_filtered_combobox(
+            ttk.Combobox(
+                self,
+                values=self.counties.choices,
+                validate='focusout',
+                validatecommand=vcmd,
+                invalidcommand=invcmd
+            ),
+            self.counties
         )
         county_row = self.main_text.index('County:')
         self.county.grid(row=county_row, column=2, sticky='WE')
@@ -353,51 +492,74 @@ class MainFrame(ttk.Frame):
             photo=self.photo
         )
 
-        # Create movable widgets (don't position yet)
-        self.movable = {}
-        self.movable['adder'] = ttk.Button(
+        # Create and position the list of applications, one frame per
+        # application (scrolled with the rest of the window by the canvas),
+        # with the controls below it. Adding and removing applications
+        # only packs or destroys a frame, so nothing else is regridded.
+        list_row = len(self.main_text)
+        self.app_list = ttk.Frame(self)
+        self.app_list.grid(row=list_row, column=2, columnspan=2, sticky='WE')
+
+        self.controls = {}
+        self.controls['adder'] = ttk.Button(
             self,
             text='+',
             command=self.add_button
         )
-        self.movable['remover'] = ttk.Button(
+        self.controls['adder'].grid(row=list_row, column=0, sticky='N')
+        self.controls['remover'] = ttk.Button(
             self,
             text='-',
             command=self.rm_button
         )
-        self.movable['submitter'] = ttk.Button(
+        self.controls['remover'].grid(row=list_row, column=1, sticky='N')
+        self.controls['submitter'] = ttk.Button(
             self,
             text='Calculate buffer zones',
             command=self._run
         )
-        self.movable['submitter_help'] = make_help_label(self,
-                                                         app_msg,
-                                                         self.photo
-                                                         )
+        self.controls['submitter'].grid(
+            row=list_row+1,
+            column=2,
+            sticky='WE',
+            pady=25
+        )  # Add space between rows. (padx shirnks widget width.)
+        self.controls['submitter_help'] = make_help_label(self,
+                                                          app_msg,
+                                                          self.photo,
+                                                          row=list_row+1,
+                                                          column=3
+                                                          )
 
         logo_photo_path = os.path.join(self.base_path, 'EM-Large Logo.gif')
         self.logophoto = tk.PhotoImage(file=logo_photo_path
         ).subsample(6,6)
-        self.movable['logo'] = ttk.Label(self, image=self.logophoto)
+        self.controls['logo'] = ttk.Label(self, image=self.logophoto)
+        self.controls['logo'].grid(
+            row=list_row+2, column=0, columnspan=4,
+            sticky=tk.N+tk.E+tk.S+tk.W)
 
         # Other instance variables
         self.root = self.winfo_toplevel()
         self.applications = []
-        self.details = []
+        self.details = []  # Entered details for each application
+        self.details_window = None  # Created when first opened
+        self._worker = None  # Thread running a calculation, if any
+        self._progress = None  # Progress window, if shown
 
     def _hide_main(self, idx):
         '''Open window to input application-specific parameters'''
-        details = self.details[idx]
-        details.geometry(self.root.geometry())  # Sync windows' dimensions
-        details.deiconify()  # show application window
+        if self.details_window is None:
+            self.details_window = Details(self)
+        self.details_window.show(idx + 1)
         self.root.withdraw()  # hide main window
 
     def add_button(self):
-        '''Create app details window, button to switch to app details window,
-        and labels on main screen showing details'''
-        def init_main_details(text, row, column):
-            lab = ttk.Label(self, text=text)
-            lab.grid(row=row, column=column, sticky='W')
+        '''Create app details, a row in the list of applications with a
+        button to switch to app details window, and labels showing details'''
+        def init_main_details(row, text, r, column):
+            lab = ttk.Label(row, text=text)
+            lab.grid(row=r, column=column, sticky='W')
             return lab
 
         def strip_units(s):
@@ -405,114 +567,139 @@ class MainFrame(ttk.Frame):
 
         idx = len(self.applications)
         app_number = idx + 1
-        main_details = {k:v for k,v in self.details_text.items()
+        main_details = [(k,v) for k,v in self.details_text.items()
             if k != 'broad_opt'
-        }
-        button_row = len(self.main_text) + (
-            idx * (len(main_details) + 1)
-        )
+        ]
+
+        row = ttk.Frame(self.app_list)
+        row.pack(side='top', fill='x')
+        # Fixed label width keeps the rows' columns aligned
+        row.columnconfigure(0, minsize=self.summary_width)
 
         button = ttk.Button(
-            self,
+            row,
             text='Application {} details'.format(app_number),
             command=functools.partial(self._hide_main, idx)
         )
-        button.grid(row=button_row, column=2, sticky='WE')
+        button.grid(row=0, column=0, sticky='WE')
+        button.row = row
         self.applications.append(button)
 
         button.details_labels = OrderedDict(
-            (k, init_main_details(strip_units(v), button_row+i+1, 2))
-            for i, (k,v) in enumerate(main_details.items())
+            (k, init_main_details(row, strip_units(v), i+1, 0))
+            for i, (k,v) in enumerate(main_details)
         )
         button.details = OrderedDict(
-            (k, init_main_details('', button_row+i+1, 3))
-            for i, (k,v) in enumerate(main_details.items())
+            (k, init_main_details(row, '', i+1, 1))
+            for i, (k,v) in enumerate(main_details)
         )
 
-        self.details.append(Details(self, app_number))
-
-        self._adjust_buttons(button_row)
+        details = dict.fromkeys(self.details_text, '')
+        details.update(broad_opt=0, units='')
+        self.details.append(details)
 
     def rm_button(self):
-        '''Destroy newest app button and associated widgets, if multiple
-        buttons exist'''
-        idx = len(self.applications)
-
-        if idx > 1:
+        '''Destroy newest app row and its details, if multiple applications
+        exist'''
+        if len(self.applications) > 1:
             button = self.applications.pop()
-            button_row = len(self.main_text) + ((idx - 2) * (
-                len(button.details) + 1))
-            for k,v in button.details_labels.items():
-                v.destroy()
-                button.details[k].destroy()
-            button.destroy()
-            details = self.details.pop()
-            details.destroy()
-            self._adjust_buttons(button_row)
-
-    def _adjust_buttons(self, row):
-        '''Adjust other buttons to accommodate new/rm application button'''
-        offset = row + len(self.applications[-1].details) + 1
-
-        self.movable['adder'].grid(row=row, column=0)
-        self.movable['remover'].grid(row=row, column=1)
-        self.movable['submitter'].grid(
-            row=offset,
-            column=2,
-            sticky='WE',
-            pady=25
-        )  # Add space between rows. (padx shirnks widget width.)
-        self.movable['submitter_help'].grid(row=offset, column=3, sticky='W')
-        self.movable['logo'].grid(
-            row=offset+1, column=0, columnspan=4,
-            sticky=tk.N+tk.E+tk.S+tk.W)
+            button.row.destroy()  # Also destroys the row's widgets
+            self.details.pop()
 
     def _run(self):
-        '''Run command line script (appk.py) for buffer zone calculation'''
-        def show_results(results):
-            messagebox.showinfo('Buffer-zone Determination', results)
-
-        def get_app_num(app):
-            num = app['number']
-            return num if isinstance(num, int) else int(num[0])
+        '''Start buffer zone calculation (appk.py) in a background thread, so
+        that the window stays responsive. Ignored while a calculation is
+        already running.'''
+        if self._worker is not None:
+            return
 
         # Extract values from main and application widgets
         recalc = True if self.overlap_var.get() else False
-        county = self._verify_county()
         app_details = self._verify_details()
-        if not app_details or not county:
-            return
-
-        # Pass args to appk.py and collect results
-        with contextlib.suppress(SystemExit), Capturing() as out:
-            apps = appk.main(recalc, county, app_details)
-
-        # Display "error" messages
-        out = ''.join(out)
-        if out:  # Display error messages from appk.py
-            self._prompt(out)
+        if not app_details:
             return
+        county = None  # Only needed by applications without their own
+        if not all(app.county for app in app_details):
+            county = self._verify_county()
+            if not county:
+                return
+
+        # Pass args to appk.py in a worker thread, which reports back
+        # through a queue that _poll checks from the Tk event loop
+        self.controls['submitter'].state(['disabled'])
+        self._results = queue.Queue()
+        self._cancel = threading.Event()
+        self._started = time.monotonic()
+        self._worker = threading.Thread(
+            target=self._calculate,
+            args=(recalc, county, app_details, self._results, self._cancel),
+            daemon=True
+        )
+        self._worker.start()
+        self.after(self.poll_ms, functools.partial(self._poll, recalc))
 
-        # Display results
-        if recalc:
-            show_results(mod_msg)
-        apps = sorted(apps, key=get_app_num)
-        rpw = 5  # results per window
-        apps_split = [apps[i:i+rpw] for i in range(0, len(apps), rpw)]
-        for i, group in enumerate(apps_split):
-            results = self._construct_results(
-                group,
-                i+1,
-                len(apps_split)
-            )
-            show_results(results)
+    @staticmethod
+    def _calculate(recalc, county, apps, results, cancel):
+        '''Run appk.main and put its progress and outcome on the results
+        queue. Runs in the worker thread, so must not touch any widgets.'''
+        def progress(done, total):
+            if cancel.is_set():
+                raise Cancelled()
+            results.put(('progress', (done, total)))
+
+        try:
+            results.put(('done', appk.main(recalc, county, apps, progress)))
+        except Exception as e:
+            results.put(('error', e))
+
+    def _poll(self, recalc):
+        '''Check on the worker thread: update the progress window, and show
+        results or errors once the calculation finishes'''
+        progress = None
+        try:
+            while True:
+                kind, value = self._results.get_nowait()
+                if kind == 'progress':
+                    progress = value
+                    continue
+                self._finish()
+                if kind == 'done':
+                    self._show_results(recalc, value)
+                elif isinstance(value, appk.AppkError):
+                    self._prompt(str(value))  # Error messages from appk.py
+                elif not isinstance(value, Cancelled):
+                    raise value
+                return
+        except queue.Empty:
+            pass
+
+        # Only show progress for calculations that take a noticeable time
+        elapsed = time.monotonic() - self._started
+        if self._progress is None and elapsed > self.progress_delay:
+            self._progress = Progress(self, self._cancel.set)
+        if self._progress is not None and progress is not None:
+            self._progress.update_progress(*progress)
+        self.after(self.poll_ms, functools.partial(self._poll, recalc))
+
+    def _finish(self):
+        '''Clean up after the worker thread finishes'''
+        if self._progress is not None:
+            self._progress.destroy()
+            self._progress = None
+        self._worker = None
+        self.controls['submitter'].state(['!disabled'])
+
+    def _show_results(self, recalc, apps):
+        '''Display results in a single window'''
+        Results(self, self._result_rows(apps), note=mod_msg if recalc else None)
 
     @staticmethod
     def _prompt(warning):
         messagebox.showwarning('Warning', warning)
 
     def _verify_county(self):
-        '''Verify that the county has been entered (fully)'''
+        '''Verify that the county has been entered (fully), for applications
+        without a county of their own'''
         county = self.county.get()
         if not county or county not in self.counties:
             warning = (
@@ -526,47 +713,46 @@ class MainFrame(ttk.Frame):
         return county
 
     def _verify_details(self):
-        '''Verify that each application with a details window has all
-        details, retrieve widget values for appk.py, use value of
+        '''Verify that each application has all details, retrieve the
+        entered values for appk.py, use value of
         registration number to retrieve relevant values from the
-        products table, and convert numeric strings to numeric'''
+        products table, and convert numeric strings to numeric. Returns a
+        list of appk.Application.'''
         def check_app_details(d, app_num):
-            '''NOTE: tk.Combobox.get is in fact tk.Entry.get'''
-
-            def check_detail(widget):
-                user_input = widget.get()
+            def check_detail(user_input):
                 try:
                     return float(user_input)
                 except ValueError:
                     return user_input
 
-            app = {
-                k:check_detail(v) for k,v in d.app_details.items()
-                if k != 'broad_opt'
-            }
-            app['broad_opt'] = d.broad_opt_var.get()
+            app = {k:check_detail(v) for k,v in d.items() if k != 'broad_opt'}
+            app['broad_opt'] = d['broad_opt']
 
-            exclude = ['broad_opt']
+            app['county'] = app['county'] or None  # Main window's county
+            exclude = ['broad_opt', 'county']
             if app['broad_opt']:
                 exclude += ['strip', 'center']
             if not all(v for k,v in app.items() if k not in exclude):
                 return False
+            if app['units'] not in appk.units_labels:
+                return False
+            if app['county'] and app['county'] not in self.counties:
+                return False
 
-            prod_idx = self.products['SHOW_REGNO'].index(app['regno'])
-            app['number'] = app_num
-            app['density'] = float(
-                self.products['Density (lb/gallon)'][prod_idx]
+            product = self.products[app['regno']]
+            return appk.Application(
+                number=app_num,
+                density=product.density,
+                percent=product.percent,
+                name=product.name,
+                factor=self.products.factor(app['regno'], app['units']),
+                **app
             )
-            app['percent'] = float(
-                self.products['PRODCHEM_PCT'][prod_idx]
-            )
-            app['name'] = self.products['PRODUCT_NAME'][prod_idx]
-
-            return app
 
         warning = (
             'Application(s) {} are missing necessary details. Please fill out '
-            'all of the fields listed in each application window.'
+            'all of the fields listed in each application window, choosing '
+            'units and any county from the dropdowns.'
         )
         apps = [check_app_details(d, i+1) for i,d in enumerate(self.details)]
         missing = [str(i+1) for i,a in enumerate(apps) if not a]
@@ -579,55 +765,29 @@ class MainFrame(ttk.Frame):
             return False
         return apps
 
-    def _tbl_num(self, method):
-        '''Return table used to determine buffer,
-        as listed in Appendix K'''
-        county = self.county.get()
-        files = (
-            appk.coastal_csv if county in appk.coastal else appk.inland_csv
-        )
-        file = files[appk.app_methods[1:].index(method)]
-        prefix = file.split('.')[0]
-        re_list = re.split('(\d+)', prefix)
-        list_filt = [s for s in re_list if s]
-        tbl = ''
-        for i, s in enumerate(list_filt):
-            if i == 1:
-                tbl += ' {}'.format(s)
-            else:
-                tbl += s
-        return tbl
-
-    def _construct_results(self, apps, win_num=None, win_num_max=None,
-        results=''):
-        template = (
-            'Application {}:\n'
-            'Product: {}\n'
-            'Buffer-zone distance: {} feet\n'
-            '(Calculated using {}, a broadcast-equivalent rate '
-            'of {} lbs A.I./acre and an application '
-            'block of {} acres.)\n\n'
-        )
-        # Products spreadsheet has 3 sig digs, but only 1 shown
+    def _result_rows(self, apps):
+        '''Return (sort keys, displayed values) for each result'''
+        rows = []
         for app in apps:
-            results += template.format(
-                app['number'],
-                '{} ({})'.format(app['regno'], app['name']),
-                app['buffer'],
-                self._tbl_num(app['method']),
-                appk.truncate(app['broadcast'], n=1),
-                appk.truncate(app['block'], n=1)
-            )
-        if win_num and win_num_max:
-            results += 'Results {} of {}'.format(
-                win_num, win_num_max
-            )
-        return results
+            tbl = appk.table_label(app.method, app.county_type)
+            product = '{} ({})'.format(app.regno, app.name)
+            keys = (app.applications[0].number, product, app.buffer, tbl,
+                    app.broadcast, app.block)
+            # Products spreadsheet has 3 sig digs, but only 1 shown
+            values = (app.number, product, app.buffer, tbl,
+                      appk.truncate(app.broadcast, n=1),
+                      appk.truncate(app.block, n=1))
+            rows.append((keys, values))
+        return rows
 
 
 class Details(tk.Toplevel):
-    '''Window for filling in application details'''
-    def __init__(self, mainframe, app_number):
+    '''Window for filling in application details. A single window is
+    reused for every application: show loads an application's details into
+    it, and saving writes them back to MainFrame.details.'''
+    methods = appk.PrefixIndex(appk.app_methods)
+
+    def __init__(self, mainframe):
         def validate_date(P):
             '''Ensure yyyy-mm-dd format'''
             try:
@@ -640,10 +800,13 @@ class Details(tk.Toplevel):
                 return True
 
         def validate_app_method(P):
-            return P in appk.app_methods
+            return P in self.methods
 
         def validate_regno(P):
-            return P in self.mainframe.products['SHOW_REGNO']
+            return P in self.mainframe.products
+
+        def validate_county(P):
+            return not P or P in self.mainframe.counties
 
         def validate_entry(P):
             '''Ensure that input is numeric
@@ -688,6 +851,14 @@ class Details(tk.Toplevel):
             )
             invalid_value(W, warning)
 
+        def invalid_county(W):
+            warning = (
+                'The county you entered is invalid. Ensure that you enter '
+                'a valid county or select one from the dropdown list, or '
+                'leave it blank to use the county on the main window.'
+            )
+            invalid_value(W, warning)
+
         # @counter
         def create_custom(validate_fn, invalid_fn, widget, *args,
             **kwargs):
@@ -703,10 +874,17 @@ class Details(tk.Toplevel):
             )
 
         def hide():
-            '''Update mainframe labels with input details and hide window.'''
+            '''Save input details, update mainframe labels with them and hide
+            window.'''
+            details = self.mainframe.details[self.app_number - 1]
+            for k,v in self.app_details.items():
+                if k != 'broad_opt':
+                    details[k] = v.get()
+            details['broad_opt'] = self.broad_opt_var.get()
+
             button = self.mainframe.applications[self.app_number - 1]
-            apps = {k:self.app_details[k].get() for k in button.details.keys()}
-            units = self.app_details['units'].get()
+            apps = {k:details[k] for k in button.details.keys()}
+            units = details['units']
 
             apps['block'] += ' acres' if apps['block'] else ''
 
@@ -721,50 +899,28 @@ class Details(tk.Toplevel):
 
             regno = apps['regno']
             if regno:
-                products = self.mainframe.products
-                prod_idx = products['SHOW_REGNO'].index(regno)
-                name = products['PRODUCT_NAME'][prod_idx]
+                name = self.mainframe.products[regno].name
                 apps['regno'] += ' ' + '({})'.format(name)
 
-            if self.broad_opt_var.get():
+            if details['broad_opt']:
                 apps['strip'] = 'N/A'
                 apps['center'] = 'N/A'
 
             for k,v in button.details.items():
                 v.configure(text=apps[k])
+            button.details_labels['rate'].configure(
+                text=self.labels['rate'].cget('text'))
 
             self.mainframe.root.geometry(self.geometry())
             self.mainframe.root.deiconify()  # show main frame
             self.withdraw()
 
-        def cb_cmd(button, toggle=[False]):
+        def cb_cmd():
             '''Modify app to reflect direct input of broadcast rate'''
-            toggle[0] = not toggle[0]
-
-            app = self.app_details
-            strip, center = app['strip'], app['center']
-            if toggle[0]:
-                strip.delete(0, tk.END)
-                center.delete(0, tk.END)
-                state = 'disabled'
-                text = 'Broadcast-equivalent application rate:'
-                msg = broad_msg
-            else:
-                state = 'normal'
-                text = self.mainframe.details_text['rate']
-                msg = self.details_msgs['rate']
-
-            strip.configure(state=state)
-            center.configure(state=state)
-            self.labels['rate'].configure(text=text)
-            button.details_labels['rate'].configure(text=text)
-            row = list(self.mainframe.details_text.keys()).index('rate')
-            self.help['rate'] = make_help_label(self,
-                                                row=row,
-                                                column=2,
-                                                msg=msg,
-                                                photo=self.mainframe.photo
-                                                )
+            if self.broad_opt_var.get():
+                self.app_details['strip'].delete(0, tk.END)
+                self.app_details['center'].delete(0, tk.END)
+            self._show_broad_opt()
 
         # Configure window properties
         if sys.platform == 'darwin':  # http://wiki.tcl.tk/44444
@@ -773,13 +929,13 @@ class Details(tk.Toplevel):
             tk.Toplevel.__init__(self)
 
         # Since tk displays newly created windows, hide this window until
-        # user clicks the associated application button on main screen
+        # it is loaded with an application's details
         self.withdraw()
+        self.protocol('WM_DELETE_WINDOW', hide)
 
         # Constants and attributes
         self.mainframe = mainframe
-        self.title('Appendix K - Application {} Details'.format(app_number))
-        self.app_number = app_number
+        self.app_number = None
 
         # Create and position label widgets
         self.labels = OrderedDict((k, ttk.Label(self, text=v) )
@@ -792,20 +948,30 @@ class Details(tk.Toplevel):
         details_keys = self.mainframe.details_text.keys()
         app_details = OrderedDict.fromkeys(details_keys)
         self.broad_opt_var = tk.IntVar()
-        cb_cmd = functools.partial(cb_cmd,
-            button=self.mainframe.applications[app_number-1])
         app_details['broad_opt'] = ttk.Checkbutton(self,
             variable=self.broad_opt_var, command=cb_cmd)
         app_details['date'] = create_custom(validate_date, invalid_date,
             ttk.Entry)
-        app_details['regno'] = create_custom(validate_regno, invalid_regno,
-            ttk.Combobox, width=40, values=mainframe.products['SHOW_REGNO'])
-        app_details['method'] = create_custom(validate_app_method,
-            invalid_app_method, ttk.Combobox, width=40,
-            values=appk.app_methods)
+        regnos = mainframe.products.regnos
+        app_details['regno'] = make_filtered_combobox(
+            create_custom(validate_regno, invalid_regno, ttk.Combobox,
+                width=40, values=regnos.choices),
+            regnos)
+        app_details['method'] = make_filtered_combobox(
+            create_custom(validate_app_method, invalid_app_method,
+                ttk.Combobox, width=40, values=self.methods.choices),
+            self.methods)
+        counties = mainframe.counties
+        app_details['county'] = make_filtered_combobox(
+            create_custom(validate_county, invalid_county, ttk.Combobox,
+                width=40, values=counties.choices),
+            counties)
+        # Choices of the comboboxes filtered as the user types
+        self.filtered = {'regno': regnos, 'method': self.methods,
+                         'county': counties}
         vcmd = (self.register(validate_entry), '%P')
         for i,k in enumerate(details_keys):
-            if k not in ('broad_opt', 'date', 'regno', 'method'):
+            if k not in ('broad_opt', 'date', 'regno', 'method', 'county'):
                 app_details[k] = ttk.Entry(self, validate='key',
                     validatecommand=vcmd)
             app_details[k].lift()  # Fix tab order (defaults to creation order)
@@ -814,8 +980,7 @@ class Details(tk.Toplevel):
 
         # Create and position combox widget for app-method units selection
         self.app_details['units'] = ttk.Combobox(self, width=21,
-            values=('lbs product / treated acre',
-                    'gal product / treated acre'))
+            values=appk.units_labels)
         row = list(details_keys).index('rate')
         self.app_details['units'].grid(row=row, column=3)
 
@@ -836,7 +1001,8 @@ class Details(tk.Toplevel):
                     strip_msg,
                     center_msg,
                     regno_msg,
-                    method_msg
+                    method_msg,
+                    app_county_msg
                 )
             )
         )
@@ -857,6 +1023,49 @@ class Details(tk.Toplevel):
             columnspan=4,
             sticky=tk.N+tk.E+tk.S+tk.W)
 
+    def show(self, app_number):
+        '''Load the details of an application into the window and show it'''
+        self.app_number = app_number
+        self.title('Appendix K - Application {} Details'.format(app_number))
+
+        details = self.mainframe.details[app_number - 1]
+        for k,v in self.app_details.items():
+            if k != 'broad_opt':
+                v.configure(state='normal')
+                v.delete(0, tk.END)
+                v.insert(0, details[k])
+        for k, choices in self.filtered.items():  # Not the last app's filter
+            filter_choices(self.app_details[k], choices)
+        self.broad_opt_var.set(details['broad_opt'])
+        self._show_broad_opt()
+
+        self.geometry(self.mainframe.root.geometry())  # Sync dimensions
+        self.deiconify()
+
+    def _show_broad_opt(self):
+        '''Configure fields for direct input of the broadcast rate, or for
+        its calculation'''
+        if self.broad_opt_var.get():
+            state = 'disabled'
+            text = self.mainframe.broad_rate_text
+            msg = broad_msg
+        else:
+            state = 'normal'
+            text = self.mainframe.details_text['rate']
+            msg = self.details_msgs['rate']
+
+        self.app_details['strip'].configure(state=state)
+        self.app_details['center'].configure(state=state)
+        self.labels['rate'].configure(text=text)
+        self.help['rate'].destroy()
+        row = list(self.mainframe.details_text.keys()).index('rate')
+        self.help['rate'] = make_help_label(self,
+                                            row=row,
+                                            column=2,
+                                            msg=msg,
+                                            photo=self.mainframe.photo
+                                            )
+
 #==============================================================================
 # Spawn a TCL interpreter
 #==============================================================================
@@ -23,13 +23,32 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
+import os
+import sys
+
+# Compile the newest table set and the products sheet so the executable
+# starts without parsing any CSV (see appk.compile_tables). The file is
+# written to the build directory, as running from source ignores it.
+sys.path.insert(0, SPECPATH)
+import appk
+table_sets = appk.TableSets(os.path.join(SPECPATH, 'Tables'))
+tables_dir = os.path.join(SPECPATH, 'Tables', '112017')
+if table_sets.active:
+    tables_dir = table_sets.path(table_sets.active)
+compiled_path = os.path.join(workpath, 'appk_tables.bin')
+os.makedirs(workpath, exist_ok=True)
+appk.compile_tables(
+    compiled_path,
+    tables_dir=tables_dir,
+    products_path=os.path.join(SPECPATH, 'chloropicrin_products.csv'))
+
 block_cipher = None
 
 
 a = Analysis(['guik.py'],
              pathex=['C:\\Users\\jkroes\\Desktop\\MyProjects\\appk'],
              binaries=[],
-             datas=[('help.gif', '.'), ('EM-Large Logo.gif', '.'), ('Tables\\112017', 'Tables\\112017'), ('chloropicrin_products.csv', '.')],
+             datas=[('help.gif', '.'), ('EM-Large Logo.gif', '.'), (compiled_path, '.')],
              hiddenimports=[],
              hookspath=[],
              runtime_hooks=[],